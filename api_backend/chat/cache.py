@@ -1,16 +1,88 @@
-from django.core.cache import cache
 from django.conf import settings
+from django_redis import get_redis_connection
 import json
 from datetime import datetime
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Снимает аренду, только если она все еще принадлежит этому обработчику
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Снимает отметку с чата, только если в буфере не осталось сообщений:
+# проверка и удаление атомарны относительно новых отправок
+CLEAN_IF_EMPTY_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) == 0 then
+    return redis.call('SREM', KEYS[2], ARGV[1])
+end
+return 0
+"""
+
+# Добавляет сообщение в буфер, очередь на сохранение и счетчики непрочитанных.
+# Отметка uuid ставится в том же скрипте: повтор отбрасывается, только если
+# исходное сообщение действительно попало в буфер
+CACHE_MESSAGE_SCRIPT = """
+if ARGV[1] == '1' and not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[2]) then
+    return 0
+end
+redis.call('RPUSH', KEYS[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('SADD', KEYS[3], ARGV[5])
+for i = 4, #KEYS do
+    redis.call('HINCRBY', KEYS[i], ARGV[5], 1)
+    redis.call('EXPIRE', KEYS[i], ARGV[6])
+end
+return 1
+"""
+
+# Заполняет множество участников, только если состав чата не менялся
+# с момента чтения из базы (версию увеличивает сброс кэша)
+FILL_MEMBERS_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
 class MessageCache:
     CACHE_PREFIX = "chat_messages:"
-    UNREAD_PREFIX = "unread_messages:"
-    PARTICIPANTS_PREFIX = "chat_participants:"
-    CACHE_TIMEOUT = 900  # 15 минут = 900 секунд
+    UNREAD_PREFIX = "unread:"
+    MEMBERS_PREFIX = "chat_members:"
+    MEMBERS_VERSION_PREFIX = "chat_members_version:"
+    DIRTY_KEY = "chat_dirty"
+    LEASE_PREFIX = "chat_flush_lease:"
+    SEEN_PREFIX = "chat_message_seen:"
+    # Буфер хранится до сохранения в базу; срок хранения - страховка на случай остановки воркеров
+    CACHE_TIMEOUT = 60 * 60 * 24 * 7
+    # Сохранение одного чата: сообщений за транзакцию, транзакций за запуск и срок аренды
+    FLUSH_BATCH_SIZE = 500
+    FLUSH_MAX_BATCHES = 4
+    LEASE_TIMEOUT = 120
+    # Чатов за один запуск задачи
+    FLUSH_MAX_CHATS = 100
+    # Счетчики непрочитанных живут дольше буфера: пользователь может не заходить неделями
+    UNREAD_TIMEOUT = 60 * 60 * 24 * 30
+    # Состав чата сбрасывается сигналами Participant, срок хранения - страховка
+    MEMBERS_TIMEOUT = 5 * 60
+    # Версия состава должна пережить любое заполнение, начатое до сброса
+    MEMBERS_VERSION_TIMEOUT = 60 * 60 * 24
+    # Метка заполненного множества: чат без участников отличается от незагруженного
+    MEMBERS_SENTINEL = "-"
+    # Повторная отправка с тем же uuid отбрасывается, пока жива отметка
+    SEEN_TIMEOUT = 60 * 60
+
+    @classmethod
+    def get_connection(cls):
+        """Прямое соединение с Redis для списков и атомарных операций"""
+        return get_redis_connection("default")
 
     @classmethod
     def get_cache_key(cls, chat_id):
@@ -23,52 +95,112 @@ class MessageCache:
         return f"{cls.UNREAD_PREFIX}{user_id}"
 
     @classmethod
-    def get_participants_key(cls, chat_id):
-        return f"{cls.PARTICIPANTS_PREFIX}{chat_id}"
+    def get_lease_key(cls, chat_id):
+        return f"{cls.LEASE_PREFIX}{chat_id}"
+
+    @classmethod
+    def get_members_key(cls, chat_id):
+        return f"{cls.MEMBERS_PREFIX}{chat_id}"
+
+    @classmethod
+    def get_seen_key(cls, message_uuid):
+        return f"{cls.SEEN_PREFIX}{message_uuid}"
+
+    @staticmethod
+    def scope_message_uuid(user_id, client_uuid):
+        """UUID сообщения из клиентского: одинаковый клиентский uuid у разных отправителей не совпадает"""
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"chat-message:{user_id}:{client_uuid}")
+
+    @classmethod
+    def get_members_version_key(cls, chat_id):
+        return f"{cls.MEMBERS_VERSION_PREFIX}{chat_id}"
+
+    @classmethod
+    def load_participant_ids(cls, chat_id):
+        """
+        Заполняет множество участников чата одним запросом к базе. Если состав
+        сбросили, пока шел запрос, прочитанные данные устарели и в кэш не пишутся.
+        """
+        from .models import Participant
+
+        redis = cls.get_connection()
+        version_key = cls.get_members_version_key(chat_id)
+        version = (redis.get(version_key) or b'0').decode()
+        user_ids = list(Participant.objects.filter(chat_id=chat_id).values_list('user_id', flat=True))
+        redis.eval(
+            FILL_MEMBERS_SCRIPT, 2, cls.get_members_key(chat_id), version_key,
+            version, cls.MEMBERS_TIMEOUT, cls.MEMBERS_SENTINEL, *user_ids,
+        )
+        return set(user_ids)
+
+    @classmethod
+    def get_participant_ids(cls, chat_id):
+        """Id участников чата из множества Redis"""
+        members = cls.get_connection().smembers(cls.get_members_key(chat_id))
+        if not members:
+            return cls.load_participant_ids(chat_id)
+        return {int(member) for member in members if member != cls.MEMBERS_SENTINEL.encode()}
+
+    @classmethod
+    def is_participant(cls, chat_id, user_id):
+        """Проверка участия без обращения к базе, если состав чата уже в кэше"""
+        members_key = cls.get_members_key(chat_id)
+        pipe = cls.get_connection().pipeline()
+        pipe.exists(members_key)
+        pipe.sismember(members_key, user_id)
+        loaded, is_member = pipe.execute()
+        if loaded:
+            return bool(is_member)
+        return user_id in cls.load_participant_ids(chat_id)
+
+    @classmethod
+    def invalidate_participants(cls, chat_id):
+        version_key = cls.get_members_version_key(chat_id)
+        pipe = cls.get_connection().pipeline()
+        pipe.incr(version_key)
+        pipe.expire(version_key, cls.MEMBERS_VERSION_TIMEOUT)
+        pipe.delete(cls.get_members_key(chat_id))
+        pipe.execute()
 
     @classmethod
-    def cache_message(cls, chat_id, user_id, message_text):
-        """Cache a new message"""
+    def cache_message(cls, chat_id, user_id, message_text, message_uuid=None):
+        """
+        Cache a new message. Returns (message_data, created); created is False
+        for a repeated message_uuid, which is not buffered, broadcast or counted again.
+        """
         try:
             cache_key = cls.get_cache_key(chat_id)
             message_data = {
+                'uuid': str(cls.scope_message_uuid(user_id, message_uuid) if message_uuid else uuid.uuid4()),
                 'user_id': user_id,
                 'message': message_text,
                 'timestamp': datetime.now().isoformat(),
-                'is_persisted': False,
-                'read_by': []
             }
-            
-            # Get existing messages or initialize new list
-            cached_messages = cache.get(cache_key) or []
-            cached_messages.append(message_data)
-            cache.set(cache_key, cached_messages, cls.CACHE_TIMEOUT)
-            
-            # Получаем список участников из кэша
-            participants_key = cls.get_participants_key(chat_id)
-            participant_ids = cache.get(participants_key) or []
-            
-            # Добавляем сообщение в список непрочитанных для всех участников
-            for participant_id in participant_ids:
-                if participant_id != user_id:  # Не добавляем для отправителя
-                    unread_key = cls.get_unread_key(participant_id)
-                    unread_messages = cache.get(unread_key) or {}
-                    
-                    if str(chat_id) not in unread_messages:
-                        unread_messages[str(chat_id)] = []
-                    
-                    unread_messages[str(chat_id)].append({
-                        'message_id': len(cached_messages) - 1,
-                        'sender_id': user_id,
-                        'chat_id': chat_id,
-                        'message': message_text,
-                        'timestamp': message_data['timestamp']
-                    })
-                    
-                    cache.set(unread_key, unread_messages, cls.CACHE_TIMEOUT)
+
+            participant_ids = cls.get_participant_ids(chat_id)
+            # Непрочитанные - счетчики по чатам в хэше получателя, текст хранится только в буфере
+            unread_keys = [
+                cls.get_unread_key(participant_id)
+                for participant_id in participant_ids
+                if participant_id != user_id  # Не добавляем для отправителя
+            ]
+
+            # Буфер чата - список Redis: добавление атомарно и не зависит от длины истории;
+            # чат с несохраненными сообщениями попадает в очередь на сохранение
+            created = cls.get_connection().eval(
+                CACHE_MESSAGE_SCRIPT,
+                3 + len(unread_keys),
+                cls.get_seen_key(message_data['uuid']), cache_key, cls.DIRTY_KEY, *unread_keys,
+                '1' if message_uuid else '0', cls.SEEN_TIMEOUT,
+                json.dumps(message_data, ensure_ascii=False), cls.CACHE_TIMEOUT,
+                chat_id, cls.UNREAD_TIMEOUT,
+            )
+            if not created:
+                logger.info(f"Duplicate message {message_data['uuid']} ignored for chat {chat_id}")
+                return message_data, False
             
             logger.info(f"Successfully cached message for chat {chat_id}")
-            return message_data
+            return message_data, True
             
         except Exception as e:
             logger.error(f"Error caching message: {str(e)}")
@@ -79,22 +211,30 @@ class MessageCache:
         """Get all cached messages for a chat"""
         try:
             cache_key = cls.get_cache_key(chat_id)
-            messages = cache.get(cache_key) or []
+            messages = [json.loads(item) for item in cls.get_connection().lrange(cache_key, 0, -1)]
             logger.info(f"Retrieved {len(messages)} messages from cache for chat {chat_id}")
             return messages
         except Exception as e:
             logger.error(f"Error retrieving cached messages: {str(e)}")
             return []
 
+    @staticmethod
+    def get_message_uuid(chat_id, msg_data):
+        """UUID сообщения буфера; записям без него присваивается детерминированный"""
+        if msg_data.get('uuid'):
+            return uuid.UUID(msg_data['uuid'])
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"chat:{chat_id}:{msg_data['user_id']}:{msg_data['timestamp']}")
+
     @classmethod
-    def persist_messages(cls, chat_id):
-        """Move cached messages to PostgreSQL"""
+    def persist_messages(cls, chat_id, limit=None):
+        """Move cached messages to PostgreSQL (at most limit oldest messages)"""
         from .models import Message, Chat
         from django.db import transaction
         
         try:
             cache_key = cls.get_cache_key(chat_id)
-            messages = cls.get_cached_messages(chat_id)
+            redis = cls.get_connection()
+            messages = [json.loads(item) for item in redis.lrange(cache_key, 0, limit - 1 if limit else -1)]
             
             if not messages:
                 logger.info(f"No messages to persist for chat {chat_id}")
@@ -102,44 +242,123 @@ class MessageCache:
             
             logger.info(f"Starting persistence of {len(messages)} messages for chat {chat_id}")
             
-            # Создаем сообщения в базе данных в одной транзакции
+            # Создаем сообщения в базе данных одной вставкой; уже сохраненные (повтор после сбоя
+            # между фиксацией и очисткой буфера) пропускаются по уникальному uuid
             with transaction.atomic():
-                chat = Chat.objects.get(id=chat_id)
-                persisted_messages = []
-                
+                try:
+                    chat = Chat.objects.get(id=chat_id)
+                except Chat.DoesNotExist:
+                    # Сообщения удаленного чата сохранить некуда
+                    logger.warning(f"Chat {chat_id} does not exist, dropping {len(messages)} cached messages")
+                    redis.ltrim(cache_key, len(messages), -1)
+                    return []
+                # При повторе uuid в буфере сохраняется первое сообщение
+                unique_messages = {}
                 for msg_data in messages:
-                    if not msg_data.get('is_persisted'):
-                        try:
-                            message = Message.objects.create(
-                                chat=chat,
-                                sender_id=msg_data['user_id'],
-                                content=msg_data['message'],
-                                created_at=datetime.fromisoformat(msg_data['timestamp'])
-                            )
-                            msg_data['is_persisted'] = True
-                            persisted_messages.append(message)
-                            logger.info(f"Successfully persisted message {message.id} for chat {chat_id}")
-                        except Exception as e:
-                            logger.error(f"Error persisting individual message: {str(e)}")
-                            continue
-                
-                # Обновляем кэш с отметками о сохранении
-                if persisted_messages:
-                    cache.set(cache_key, messages, cls.CACHE_TIMEOUT)
-                    logger.info(f"Successfully persisted {len(persisted_messages)} messages for chat {chat_id}")
-                
-                return persisted_messages
+                    unique_messages.setdefault(cls.get_message_uuid(chat_id, msg_data), msg_data)
+                persisted_messages = [
+                    Message(
+                        uuid=message_uuid,
+                        chat=chat,
+                        sender_id=msg_data['user_id'],
+                        content=msg_data['message'],
+                        created_at=datetime.fromisoformat(msg_data['timestamp'])
+                    )
+                    for message_uuid, msg_data in unique_messages.items()
+                ]
+                Message.objects.bulk_create(persisted_messages, ignore_conflicts=True)
+
+            # Убираем из буфера только сохраненные сообщения: пришедшие во время
+            # сохранения добавлены в конец списка и остаются в нем
+            redis.ltrim(cache_key, len(messages), -1)
+            logger.info(f"Successfully persisted {len(persisted_messages)} messages for chat {chat_id}")
+            return persisted_messages
             
         except Exception as e:
             logger.error(f"Error in persist_messages: {str(e)}")
             return []
 
+    @classmethod
+    def drain_legacy_buffers(cls):
+        """
+        Сохраняет в базу сообщения из буферов прежнего формата (список в django cache
+        под тем же префиксом) и удаляет эти ключи. Запускается один раз при выкладке,
+        повторный запуск ничего не дублирует. Возвращает (число чатов, число сообщений).
+        """
+        from django.core.cache import cache
+        from django.db import transaction
+        from .models import Message, Chat
+
+        chats = total_messages = 0
+        for key in list(cache.iter_keys(f"{cls.CACHE_PREFIX}*")):
+            chat_id = key[len(cls.CACHE_PREFIX):]
+            pending = [msg for msg in cache.get(key) or [] if not msg.get('is_persisted')]
+            with transaction.atomic():
+                if pending and Chat.objects.filter(id=chat_id).exists():
+                    unique_messages = {}
+                    for msg_data in pending:
+                        unique_messages.setdefault(cls.get_message_uuid(chat_id, msg_data), msg_data)
+                    Message.objects.bulk_create([
+                        Message(
+                            uuid=message_uuid,
+                            chat_id=chat_id,
+                            sender_id=msg_data['user_id'],
+                            content=msg_data['message'],
+                            created_at=datetime.fromisoformat(msg_data['timestamp'])
+                        )
+                        for message_uuid, msg_data in unique_messages.items()
+                    ], ignore_conflicts=True)
+                    chats += 1
+                    total_messages += len(unique_messages)
+            cache.delete(key)
+            logger.info(f"Drained {len(pending)} legacy cached messages for chat {chat_id}")
+        return chats, total_messages
+
+    @classmethod
+    def flush_chat(cls, chat_id):
+        """
+        Сохраняет буфер чата под арендой: не более FLUSH_MAX_BATCHES транзакций
+        по FLUSH_BATCH_SIZE сообщений. Возвращает число сохраненных сообщений
+        или None, если чат уже сохраняет другой обработчик.
+        """
+        redis = cls.get_connection()
+        lease_key = cls.get_lease_key(chat_id)
+        token = uuid.uuid4().hex
+        if not redis.set(lease_key, token, nx=True, ex=cls.LEASE_TIMEOUT):
+            return None
+
+        try:
+            persisted = 0
+            for _ in range(cls.FLUSH_MAX_BATCHES):
+                batch = cls.persist_messages(chat_id, limit=cls.FLUSH_BATCH_SIZE)
+                persisted += len(batch)
+                if len(batch) < cls.FLUSH_BATCH_SIZE:
+                    break
+            # Остаток буфера (ошибка или слишком много сообщений) сохранит следующий запуск
+            redis.eval(CLEAN_IF_EMPTY_SCRIPT, 2, cls.get_cache_key(chat_id), cls.DIRTY_KEY, chat_id)
+            return persisted
+        finally:
+            redis.eval(RELEASE_LEASE_SCRIPT, 1, lease_key, token)
+
+    @classmethod
+    def flush_dirty_chats(cls, max_chats=None):
+        """Сохраняет чаты с несохраненными сообщениями; возвращает (число чатов, число сообщений)"""
+        redis = cls.get_connection()
+        chat_ids = redis.srandmember(cls.DIRTY_KEY, max_chats or cls.FLUSH_MAX_CHATS)
+        flushed_chats = total_messages = 0
+        for chat_id in chat_ids:
+            persisted = cls.flush_chat(int(chat_id))
+            if persisted is not None:
+                flushed_chats += 1
+                total_messages += persisted
+        return flushed_chats, total_messages
+
     @classmethod
     def clear_chat_cache(cls, chat_id):
         """Clear cached messages for a chat"""
         try:
             cache_key = cls.get_cache_key(chat_id)
-            cache.delete(cache_key)
+            cls.get_connection().delete(cache_key)
             logger.info(f"Cleared cache for chat {chat_id}")
         except Exception as e:
             logger.error(f"Error clearing chat cache: {str(e)}")
@@ -149,23 +368,9 @@ class MessageCache:
         """Отметить все сообщения в чате как прочитанные для пользователя"""
         try:
             unread_key = cls.get_unread_key(user_id)
-            unread_messages = cache.get(unread_key) or {}
-            
-            if str(chat_id) in unread_messages:
-                del unread_messages[str(chat_id)]
-                cache.set(unread_key, unread_messages, cls.CACHE_TIMEOUT)
+            if cls.get_connection().hdel(unread_key, chat_id):
                 logger.info(f"Marked all messages as read in chat {chat_id} for user {user_id}")
             
-            # Также отмечаем сообщения как прочитанные в кэше чата
-            cache_key = cls.get_cache_key(chat_id)
-            cached_messages = cache.get(cache_key) or []
-            
-            for message in cached_messages:
-                if user_id not in message.get('read_by', []):
-                    message.setdefault('read_by', []).append(user_id)
-            
-            cache.set(cache_key, cached_messages, cls.CACHE_TIMEOUT)
-            
         except Exception as e:
             logger.error(f"Error marking messages as read: {str(e)}")
             raise
@@ -174,17 +379,48 @@ class MessageCache:
     def get_unread_messages(cls, user_id):
         """Получить все непрочитанные сообщения для пользователя"""
         try:
-            unread_key = cls.get_unread_key(user_id)
-            unread_messages = cache.get(unread_key) or {}
-            
+            from .models import Message
+
+            redis = cls.get_connection()
+            unread_counts = {
+                chat_id.decode(): int(count)
+                for chat_id, count in redis.hgetall(cls.get_unread_key(user_id)).items()
+            }
+            if not unread_counts:
+                return []
+
+            # Тексты берутся из буфера чата, а уже сохраненные - из базы
+            pipe = redis.pipeline()
+            for chat_id in unread_counts:
+                pipe.lrange(cls.get_cache_key(chat_id), 0, -1)
+            buffers = pipe.execute()
+
             # Форматируем для удобного использования в уведомлениях
             result = []
-            for chat_id, messages in unread_messages.items():
+            for (chat_id, count), buffered in zip(unread_counts.items(), buffers):
+                messages = [
+                    message for message in map(json.loads, buffered)
+                    if message['user_id'] != user_id
+                ][-count:]
+                missing = count - len(messages)
+                if missing > 0:
+                    stored = Message.objects.filter(chat_id=chat_id).exclude(sender_id=user_id).order_by(
+                        '-created_at'
+                    ).values('sender_id', 'content', 'created_at')[:missing]
+                    messages = [
+                        {
+                            'user_id': message['sender_id'],
+                            'message': message['content'],
+                            'timestamp': message['created_at'].isoformat(),
+                        }
+                        for message in reversed(list(stored))
+                    ] + messages
+
                 for message in messages:
                     result.append({
                         'chat_id': chat_id,
                         'message': message['message'],
-                        'sender_id': message['sender_id'],
+                        'sender_id': message['user_id'],
                         'timestamp': message['timestamp']
                     })
             
@@ -198,8 +434,8 @@ class MessageCache:
     def get_unread_count(cls, user_id):
         """Получить количество непрочитанных сообщений для пользователя"""
         try:
-            unread_messages = cls.get_unread_messages(user_id)
-            return len(unread_messages)
+            counts = cls.get_connection().hvals(cls.get_unread_key(user_id))
+            return sum(int(count) for count in counts)
         except Exception as e:
             logger.error(f"Error getting unread count: {str(e)}")
             return 0
@@ -1,5 +1,6 @@
 import json
 import logging
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
@@ -27,17 +28,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.close()
                 return
 
-            User, Chat, Message, Participant = get_models()
-            
-            # Проверяем существование чата
-            try:
-                chat = await database_sync_to_async(Chat.objects.get)(id=self.chat_id)
-            except Chat.DoesNotExist:
-                logger.error(f"Chat {self.chat_id} does not exist")
-                await self.close()
-                return
-            
-            is_participant = await self.check_participant(Participant)
+            # Участие проверяется по кэшу состава чата; у несуществующего чата участников нет
+            is_participant = await self.check_participant()
             if not is_participant:
                 logger.warning(f"User {self.user.email} is not a participant of chat {self.chat_id}")
                 await self.close()
@@ -81,8 +73,24 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             )
         elif message_content:
+            # Участника могли удалить из чата после подключения
+            if not await self.check_participant():
+                logger.warning(f"User {self.user.email} is no longer a participant of chat {self.chat_id}")
+                await self.close()
+                return
+
             User, Chat, Message, Participant = get_models()
-            message_data = await self.save_message(Chat, Message, message_content)
+            message_data, created = await self.save_message(Chat, Message, message_content, data.get('uuid'))
+            if not created:
+                # Повторная отправка уже принятого сообщения: подтверждаем только отправителю,
+                # чтобы клиент сопоставил свой uuid с уже разосланным сообщением
+                await self.send(text_data=json.dumps({
+                    'type': 'message_ack',
+                    'uuid': message_data['uuid'],
+                    'client_uuid': data.get('uuid'),
+                    'duplicate': True
+                }))
+                return
             
             # Преобразуем timestamp в datetime для форматирования
             from django.utils.timezone import datetime
@@ -93,6 +101,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.chat_group_name,
                 {
                     'type': 'chat_message',
+                    'uuid': message_data['uuid'],
+                    'client_uuid': data.get('uuid'),
                     'message': message_content,
                     'sender_id': self.user.id,
                     'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S'),
@@ -113,6 +123,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         # Отправляем сообщение с соответствующим флагом is_own
         await self.send(text_data=json.dumps({
+            'uuid': event.get('uuid'),
+            'client_uuid': event.get('client_uuid') if is_sender else None,
             'message': event['message'],
             'sender_id': event['sender_id'],
             'created_at': event['created_at'],
@@ -128,46 +140,32 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
 
     @database_sync_to_async
-    def check_participant(self, Participant):
-        return Participant.objects.filter(
-            chat_id=self.chat_id,
-            user=self.user
-        ).exists()
+    def check_participant(self):
+        from .cache import MessageCache
+        return MessageCache.is_participant(self.chat_id, self.user.id)
 
-    async def save_message(self, Chat, Message, message_content):
+    async def save_message(self, Chat, Message, message_content, message_uuid=None):
         """Save message to cache and database"""
         try:
-            # Проверяем существование чата
-            try:
-                chat = await database_sync_to_async(Chat.objects.get)(id=self.chat_id)
-            except Chat.DoesNotExist:
-                logger.error(f"Chat {self.chat_id} does not exist")
-                raise
-            
-            # Получаем список участников чата асинхронно
             from .cache import MessageCache
-            from django.core.cache import cache
-            
-            # Обновляем кэш участников чата
-            participants_key = MessageCache.get_participants_key(self.chat_id)
-            participant_ids = await database_sync_to_async(
-                lambda: list(chat.participants.exclude(user_id=self.user.id).values_list('user_id', flat=True))
-            )()
-            await database_sync_to_async(cache.set)(
-                participants_key, 
-                participant_ids, 
-                MessageCache.CACHE_TIMEOUT
-            )
-            
-            # Сохраняем сообщение в кэш
-            message_data = await database_sync_to_async(MessageCache.cache_message)(
+
+            # Клиент может передать свой uuid, чтобы повторная отправка не создала дубль;
+            # в рамках отправителя он превращается в серверный uuid сообщения
+            try:
+                message_uuid = uuid.UUID(str(message_uuid)) if message_uuid else None
+            except ValueError:
+                message_uuid = None
+
+            # Сохраняем сообщение в кэш; получатели берутся из кэша состава чата
+            message_data, created = await database_sync_to_async(MessageCache.cache_message)(
                 chat_id=self.chat_id,
                 user_id=self.user.id,
-                message_text=message_content
+                message_text=message_content,
+                message_uuid=message_uuid
             )
             
             logger.info(f"Message cached for chat {self.chat_id}")
-            return message_data
+            return message_data, created
             
         except Exception as e:
             logger.error(f"Error saving message: {str(e)}")
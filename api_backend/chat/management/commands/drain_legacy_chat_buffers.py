@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from chat.cache import MessageCache
+
+
+class Command(BaseCommand):
+    help = 'Persist chat messages left in the old django-cache buffers and remove those keys'
+
+    def handle(self, *args, **options):
+        chats, messages = MessageCache.drain_legacy_buffers()
+        self.stdout.write(self.style.SUCCESS(
+            f"Сохранено {messages} сообщений из {chats} чатов старого формата"
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-17 16:40
+
+import uuid
+from django.db import migrations, models
+
+
+def fill_message_uuids(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    batch = []
+    for message in Message.objects.filter(uuid__isnull=True).only('id').iterator(chunk_size=1000):
+        message.uuid = uuid.uuid4()
+        batch.append(message)
+        if len(batch) >= 1000:
+            Message.objects.bulk_update(batch, ['uuid'])
+            batch = []
+    Message.objects.bulk_update(batch, ['uuid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True, verbose_name='Идентификатор'),
+        ),
+        migrations.RunPython(fill_message_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Идентификатор'),
+        ),
+    ]
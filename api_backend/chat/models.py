@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
+import uuid
 
 class Chat(models.Model):
     CHAT_TYPE_CHOICES = [
@@ -35,6 +36,8 @@ class Participant(models.Model):
         return f"{self.user} в чате {self.chat}"
 
 class Message(models.Model):
+    # Идентификатор, присвоенный при отправке (клиентом или сервером): повторное сохранение его не дублирует
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, verbose_name='Идентификатор')
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages', verbose_name='Чат')
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Отправитель')
     content = models.TextField(verbose_name='Содержание')
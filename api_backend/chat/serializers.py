@@ -163,8 +163,8 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['sender', 'sender_id', 'message', 'created_at', 'is_own']
-        read_only_fields = ['sender', 'sender_id', 'created_at', 'is_own']
+        fields = ['uuid', 'sender', 'sender_id', 'message', 'created_at', 'is_own']
+        read_only_fields = ['uuid', 'sender', 'sender_id', 'created_at', 'is_own']
 
     def get_created_at(self, obj):
         # Форматируем время в удобный вид
@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Participant
+from .cache import MessageCache
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def invalidate_chat_members(sender, instance, **kwargs):
+    """Сбрасывает кэш состава чата после фиксации изменения участников"""
+    chat_id = instance.chat_id
+    transaction.on_commit(lambda: MessageCache.invalidate_participants(chat_id))
@@ -9,34 +9,23 @@ from django.conf import settings
 def persist_cached_messages(chat_id=None):
     """
     Задача для сохранения кешированных сообщений в PostgreSQL.
+    Сохраняются только чаты, в которые приходили сообщения после прошлого запуска,
+    поэтому задачу можно запускать по расписанию каждые 30-60 секунд.
     
     Args:
-        chat_id: ID конкретного чата для сохранения. Если None, сохраняются сообщения всех чатов.
+        chat_id: ID конкретного чата для сохранения. Если None, сохраняются отмеченные чаты.
     """
     from chat.cache import MessageCache
-    from chat.models import Chat
-    import time
-
-    # Добавляем задержку перед сохранением (15 минут)
-    time.sleep(900)  # 15 минут = 900 секунд
 
     if chat_id is not None:
         # Сохраняем сообщения только для конкретного чата
-        try:
-            persisted_messages = MessageCache.persist_messages(chat_id)
-            return f"{len(persisted_messages)} сообщений сохранено в базу данных для чата {chat_id}."
-        except Chat.DoesNotExist:
-            return f"Чат с ID {chat_id} не найден."
-
-    # Если chat_id не указан, сохраняем сообщения всех чатов
-    chats = Chat.objects.all()
-    total_messages = 0
-
-    for chat in chats:
-        persisted_messages = MessageCache.persist_messages(chat.id)
-        total_messages += len(persisted_messages)
+        persisted = MessageCache.flush_chat(chat_id)
+        if persisted is None:
+            return f"Чат {chat_id} уже сохраняется другим обработчиком."
+        return f"{persisted} сообщений сохранено в базу данных для чата {chat_id}."
 
-    return f"{total_messages} сообщений сохранено в базу данных."
+    chats, total_messages = MessageCache.flush_dirty_chats()
+    return f"{total_messages} сообщений из {chats} чатов сохранено в базу данных."
 
 
 @shared_task
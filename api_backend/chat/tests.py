@@ -1,3 +1,52 @@
+import uuid
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from .cache import MessageCache
+from .models import Chat, Participant
 
-# Create your tests here.
+User = get_user_model()
+
+
+class CacheMessageTests(TestCase):
+    fixtures = ['json/accounts_backup/user.json']
+
+    def setUp(self):
+        self.sender, self.recipient = User.objects.order_by('pk')[:2]
+        self.chat = Chat.objects.create(chat_type='private')
+        Participant.objects.bulk_create([
+            Participant(chat=self.chat, user=self.sender),
+            Participant(chat=self.chat, user=self.recipient),
+        ])
+        self.redis = MessageCache.get_connection()
+        self.addCleanup(self.clear_keys)
+
+    def clear_keys(self):
+        self.redis.delete(
+            MessageCache.get_cache_key(self.chat.id),
+            MessageCache.get_members_key(self.chat.id),
+            MessageCache.get_unread_key(self.sender.id),
+            MessageCache.get_unread_key(self.recipient.id),
+        )
+        self.redis.srem(MessageCache.DIRTY_KEY, self.chat.id)
+        for key in self.redis.scan_iter(f"{MessageCache.SEEN_PREFIX}*"):
+            self.redis.delete(key)
+
+    def test_repeated_client_uuid_is_buffered_and_counted_once(self):
+        client_uuid = uuid.uuid4()
+        first, created = MessageCache.cache_message(self.chat.id, self.sender.id, 'Привет', client_uuid)
+        self.assertTrue(created)
+        repeat, created = MessageCache.cache_message(self.chat.id, self.sender.id, 'Привет', client_uuid)
+        self.assertFalse(created)
+
+        self.assertEqual(repeat['uuid'], first['uuid'])
+        self.assertEqual(len(MessageCache.get_cached_messages(self.chat.id)), 1)
+        self.assertEqual(MessageCache.get_unread_count(self.recipient.id), 1)
+
+    def test_client_uuid_is_scoped_to_sender(self):
+        client_uuid = uuid.uuid4()
+        own, _ = MessageCache.cache_message(self.chat.id, self.sender.id, 'Первое', client_uuid)
+        other, created = MessageCache.cache_message(self.chat.id, self.recipient.id, 'Чужое', client_uuid)
+
+        self.assertTrue(created)
+        self.assertNotEqual(own['uuid'], other['uuid'])
+        self.assertEqual(len(MessageCache.get_cached_messages(self.chat.id)), 2)
@@ -45,8 +45,8 @@ class MessageViewSet(viewsets.ModelViewSet):
         if not chat_id:
             return Message.objects.none()
 
-        # Проверяем, является ли пользователь участником чата
-        if not Participant.objects.filter(chat_id=chat_id, user=self.request.user).exists():
+        # Проверяем, является ли пользователь участником чата (по кэшу состава чата)
+        if not MessageCache.is_participant(chat_id, self.request.user.id):
             return Message.objects.none()
 
         return Message.objects.filter(
@@ -63,6 +63,9 @@ class MessageListView(ListAPIView):
 
     def get_queryset(self):
         chat_id = self.kwargs['chat_id']
+
+        if not MessageCache.is_participant(chat_id, self.request.user.id):
+            return Message.objects.none()
         
         # 1. Получаем сообщения из базы данных
         messages_from_db = Message.objects.filter(
@@ -70,7 +73,6 @@ class MessageListView(ListAPIView):
         ).order_by('-created_at')
         
         # 2. Получаем сообщения из кэша
-        from .cache import MessageCache
         cached_messages = MessageCache.get_cached_messages(chat_id)
         
         # 3. Отмечаем все сообщения как прочитанные для текущего пользователя
@@ -81,20 +83,29 @@ class MessageListView(ListAPIView):
         from django.contrib.auth import get_user_model
         User = get_user_model()
         
-        cached_message_objects = []
+        # В буфере только еще не сохраненные в БД сообщения, кроме сохраненных прямо сейчас;
+        # отправители загружаются одним запросом
+        message_uuids = {}
         for msg in cached_messages:
-            if not msg.get('is_persisted'):  # Берем только те, которых еще нет в БД
-                # Преобразуем naive datetime в aware datetime
-                created_at = datetime.fromisoformat(msg['timestamp'])
-                if created_at.tzinfo is None:
-                    created_at = make_aware(created_at)
-                    
-                cached_message_objects.append(Message(
-                    chat_id=chat_id,
-                    sender=User.objects.get(id=msg['user_id']),
-                    content=msg['message'],  # В базе это content, но в API будет message
-                    created_at=created_at
-                ))
+            message_uuids.setdefault(MessageCache.get_message_uuid(chat_id, msg), msg)
+        persisted_uuids = set(Message.objects.filter(uuid__in=list(message_uuids)).values_list('uuid', flat=True))
+        senders = User.objects.in_bulk({msg['user_id'] for msg in cached_messages})
+        cached_message_objects = []
+        for message_uuid, msg in message_uuids.items():
+            if message_uuid in persisted_uuids:
+                continue
+            # Преобразуем naive datetime в aware datetime
+            created_at = datetime.fromisoformat(msg['timestamp'])
+            if created_at.tzinfo is None:
+                created_at = make_aware(created_at)
+                
+            cached_message_objects.append(Message(
+                uuid=message_uuid,
+                chat_id=chat_id,
+                sender=senders.get(msg['user_id']),
+                content=msg['message'],  # В базе это content, но в API будет message
+                created_at=created_at
+            ))
         
         # 5. Объединяем сообщения из БД и кэша
         from itertools import chain
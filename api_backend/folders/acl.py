@@ -0,0 +1,108 @@
+from django.db import transaction
+from .models import FolderAccess
+from .visibility import grant_folder_visibility, revoke_folder_visibility
+
+WRITE_LEVELS = ('WRITE', 'ADMIN')
+ADMIN_LEVELS = ('ADMIN',)
+
+
+class FolderAccessResolver:
+    """
+    Уровни доступа пользователя к папкам проекта. Загружаются одним запросом
+    на проект и переиспользуются всеми проверками прав в рамках запроса.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._levels = {}
+
+    @classmethod
+    def for_request(cls, request):
+        """Резолвер, общий для всех проверок одного запроса"""
+        resolver = getattr(request, '_folder_access_resolver', None)
+        if resolver is None or resolver.user != request.user:
+            resolver = cls(request.user)
+            request._folder_access_resolver = resolver
+        return resolver
+
+    def levels_for(self, project_id):
+        """Словарь {id папки: уровень доступа} по проекту"""
+        if project_id not in self._levels:
+            self._levels[project_id] = dict(
+                FolderAccess.objects.filter(
+                    user=self.user,
+                    folder__project_id=project_id,
+                ).values_list('folder_id', 'access_level')
+            )
+        return self._levels[project_id]
+
+    def get_level(self, folder):
+        return self.levels_for(folder.project_id).get(folder.id)
+
+    def can_write(self, folder):
+        return self.get_level(folder) in WRITE_LEVELS
+
+    def is_admin(self, folder):
+        return self.get_level(folder) in ADMIN_LEVELS
+
+    def invalidate(self, project_id=None):
+        """Сбрасывает загруженные уровни после изменения прав"""
+        if project_id is None:
+            self._levels.clear()
+        else:
+            self._levels.pop(project_id, None)
+
+
+def revoke_access(user_id, folder_ids):
+    """
+    Отзывает доступ пользователя к папкам двумя DELETE. Сигнал post_delete
+    (для каскадов и удаления по одной записи) здесь не нужен и не вызывается.
+    """
+    accesses = FolderAccess.objects.filter(user_id=user_id, folder_id__in=folder_ids)
+    with transaction.atomic(using=accesses.db):
+        revoke_folder_visibility(user_id, folder_ids, 'ACCESS')
+        accesses._raw_delete(accesses.db)
+
+
+def grant_subtree_access(folder, user_id, access_level, granted_by):
+    """
+    Выдает уровень доступа к папке и всем ее потомкам одним upsert
+    в рамках одной транзакции. Возвращает количество папок.
+    """
+    folder_ids = [folder.id, *folder.get_descendants().values_list('id', flat=True)]
+    with transaction.atomic():
+        FolderAccess.objects.bulk_create(
+            [
+                FolderAccess(folder_id=folder_id, user_id=user_id, access_level=access_level, granted_by=granted_by)
+                for folder_id in folder_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['folder', 'user'],
+            update_fields=['access_level', 'granted_by'],
+        )
+        grant_folder_visibility(
+            [(user_id, folder.project_id, folder_id) for folder_id in folder_ids],
+            'ACCESS',
+        )
+    return len(folder_ids)
+
+
+def revoke_subtree_access(folder, user_id):
+    """Отзывает доступ к папке и всем ее потомкам. Возвращает количество папок."""
+    folder_ids = [folder.id, *folder.get_descendants().values_list('id', flat=True)]
+    with transaction.atomic():
+        revoke_access(user_id, folder_ids)
+    return len(folder_ids)
+
+
+def inherit_access(parent, folder, granted_by):
+    """Копирует права родительской папки на новую папку одной вставкой"""
+    accesses = [
+        FolderAccess(folder=folder, user_id=user_id, access_level=access_level, granted_by=granted_by)
+        for user_id, access_level in FolderAccess.objects.filter(folder=parent).values_list('user_id', 'access_level')
+    ]
+    FolderAccess.objects.bulk_create(accesses, ignore_conflicts=True)
+    grant_folder_visibility(
+        [(access.user_id, folder.project_id, folder.id) for access in accesses],
+        'ACCESS',
+    )
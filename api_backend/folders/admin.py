@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Folder, File, FolderAccess, FolderActionLog
+from .models import Folder, File, Blob, FolderAccess, FolderActionLog
 
 # Register your models here.
 
@@ -32,6 +32,15 @@ class FileAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'folder__project')
     search_fields = ('name', 'folder__name')
 
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'created_at')
+    search_fields = ('sha256',)
+    readonly_fields = ('sha256', 'file', 'size', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(FolderAccess)
 class FolderAccessAdmin(admin.ModelAdmin):
     list_display = ('folder', 'user', 'access_level', 'granted_by', 'granted_at')
@@ -0,0 +1,139 @@
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from .models import File
+from .visibility import visible_to
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Размер блока, которым файл читается из хранилища и пишется в архив
+BLOCK_SIZE = 1024 * 1024
+
+# Форматы, которые уже сжаты: в архив кладутся без повторного сжатия
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.mp4', '.mov', '.avi', '.mkv',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.dwg', '.dwfx',
+}
+
+
+class _StreamBuffer:
+    """
+    Выходной поток для ZipFile без seek/tell: zipfile пишет заголовки
+    с дескрипторами данных, а накопленные байты забираются генератором.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _unique_name(name, used):
+    if name not in used:
+        used.add(name)
+        return name
+    base, ext = os.path.splitext(name)
+    counter = 1
+    while f"{base} ({counter}){ext}" in used:
+        counter += 1
+    name = f"{base} ({counter}){ext}"
+    used.add(name)
+    return name
+
+
+def collect_entries(folder, user):
+    """
+    Список элементов архива для папки и видимых пользователю подпапок:
+    (путь в архиве, имя в хранилище или None для пустой папки, дата изменения).
+    Загружаются только метаданные, двумя запросами.
+    """
+    folders = {folder.id: folder}
+    for child in folder.get_descendants().filter(visible_to(user)).order_by('depth', 'name'):
+        folders[child.id] = child
+
+    paths = {}
+    used = set()
+    for item in folders.values():
+        if item.id == folder.id:
+            paths[item.id] = _unique_name(item.name, used)
+        elif item.parent_id in paths:
+            paths[item.id] = _unique_name(f"{paths[item.parent_id]}/{item.name}", used)
+
+    files = File.objects.filter(folder_id__in=list(paths)).order_by('folder_id', 'name').values_list(
+        'folder_id', 'name', 'file', 'updated_at'
+    )
+    entries = []
+    folders_with_files = set()
+    for folder_id, name, storage_name, updated_at in files:
+        if not storage_name:
+            continue
+        folders_with_files.add(folder_id)
+        entries.append((_unique_name(f"{paths[folder_id]}/{name}", used), storage_name, updated_at))
+
+    # Пустые папки сохраняются в архиве отдельными записями
+    for folder_id, path in paths.items():
+        if folder_id not in folders_with_files:
+            entries.append((f"{path}/", None, folders[folder_id].updated_at))
+    return entries
+
+
+def stream_zip(entries):
+    """
+    Генератор ZIP-архива. Файлы читаются блоками и сразу отдаются клиенту,
+    архив не собирается ни в памяти, ни во временном файле.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for arcname, storage_name, updated_at in entries:
+            date_time = timezone.localtime(updated_at).timetuple()[:6] if updated_at else (1980, 1, 1, 0, 0, 0)
+            zinfo = zipfile.ZipInfo(arcname, date_time=max(date_time, (1980, 1, 1, 0, 0, 0)))
+
+            if storage_name is None:
+                archive.writestr(zinfo, b'')
+                yield buffer.pop()
+                continue
+
+            extension = os.path.splitext(arcname)[1].lower()
+            zinfo.compress_type = zipfile.ZIP_STORED if extension in COMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            try:
+                source = default_storage.open(storage_name, 'rb')
+            except FileNotFoundError:
+                logger.warning(f"File {storage_name} is missing in storage, skipped in archive")
+                continue
+            with source, archive.open(zinfo, 'w', force_zip64=True) as target:
+                for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                    target.write(block)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+async def astream_zip(entries):
+    """
+    Асинхронная обертка над stream_zip для ASGI: Django собирает синхронный
+    итератор ответа целиком, поэтому блоки архива забираются из потока по одному.
+    """
+    chunks = stream_zip(entries)
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            if chunk:
+                yield chunk
+    finally:
+        # Прерванная загрузка закрывает открытый файл хранилища и архив
+        await sync_to_async(chunks.close, thread_sensitive=False)()
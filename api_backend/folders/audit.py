@@ -0,0 +1,147 @@
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.contrib.auth import get_user_model
+from projects.models import Project
+from .models import Folder, File, FolderActionLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+ACTION_TEXTS = {
+    'CREATE': 'создал(а)',
+    'UPDATE': 'изменил(а) название',
+    'DELETE': 'удалил(а)',
+    'MOVE': 'переместил(а)',
+    'UPLOAD': 'загрузил(а)',
+    'DOWNLOAD': 'скачал(а)',
+}
+
+OBJECT_NAMES = {
+    'folder': 'папку',
+    'file': 'файл',
+}
+
+
+def make_event(user, action_type, object_type, object_id=None, name=None, parent_id=None, project_uuid=None):
+    """
+    Легковесная запись о действии. Содержит только то, что уже известно
+    в запросе; имена пользователей и папок подставляются при записи в лог.
+    parent_id - родительская папка для папки или папка файла.
+    """
+    return {
+        'user_id': user.id,
+        'action_type': action_type,
+        'object_type': object_type,
+        'object_id': object_id,
+        'name': name,
+        'parent_id': parent_id,
+        'project_uuid': str(project_uuid) if project_uuid else None,
+        'deleted': action_type == 'DELETE',
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+def log_events(events):
+    """
+    Ставит события в очередь на запись после фиксации транзакции.
+    Записи уходят в Celery одной пачкой; если брокер недоступен,
+    пачка пишется синхронно.
+    """
+    if not events:
+        return
+    transaction.on_commit(lambda: _dispatch(events))
+
+
+def _dispatch(events):
+    from .tasks import write_folder_action_logs
+
+    try:
+        write_folder_action_logs.delay(events)
+    except Exception as e:
+        logger.warning(f"Audit queue unavailable, writing {len(events)} log entries inline: {str(e)}")
+        write_action_logs(events)
+
+
+def get_user_name(user):
+    if user.profile_type == 'physical':
+        try:
+            profile = user.physical_profile
+            user_name = f"{profile.last_name} {profile.first_name}"
+            if profile.middle_name:
+                user_name += f" {profile.middle_name}"
+            return user_name.strip()
+        except Exception:
+            pass
+    elif user.profile_type == 'legal':
+        try:
+            return user.legal_profile.company_name
+        except Exception:
+            pass
+    return user.email
+
+
+def write_action_logs(events):
+    """Записывает пачку событий в FolderActionLog одной вставкой"""
+    users = User.objects.select_related('physical_profile', 'legal_profile').in_bulk(
+        {event['user_id'] for event in events}
+    )
+    projects = {
+        str(project_uuid): project_id
+        for project_uuid, project_id in Project.objects.filter(
+            uuid__in={event['project_uuid'] for event in events if event['project_uuid']}
+        ).values_list('uuid', 'id')
+    }
+    # Папки событий и родительские папки: имена, проект и проверка существования
+    folders = {
+        folder_id: (name, project_id)
+        for folder_id, name, project_id in Folder.objects.filter(
+            id__in={event['parent_id'] for event in events if event['parent_id']} | {
+                event['object_id'] for event in events if event['object_type'] == 'folder' and event['object_id']
+            }
+        ).values_list('id', 'name', 'project_id')
+    }
+    existing_files = set(File.objects.filter(
+        id__in={event['object_id'] for event in events if event['object_type'] == 'file' and event['object_id']}
+    ).values_list('id', flat=True))
+
+    logs = []
+    for event in events:
+        user = users.get(event['user_id'])
+        user_name = get_user_name(user) if user else 'Система'
+        action_text = ACTION_TEXTS.get(event['action_type'], event['action_type'])
+        name = event['name']
+        parent_name = folders.get(event['parent_id'], (None, None))[0]
+        is_folder = event['object_type'] == 'folder'
+
+        if name:
+            if event['action_type'] == 'CREATE' and is_folder and parent_name:
+                description = f"{user_name} {action_text} папку '{name}' в папке '{parent_name}'"
+            elif not is_folder and not event['deleted'] and parent_name:
+                description = f"{user_name} {action_text} файл '{name}' в папке '{parent_name}'"
+            else:
+                description = f"{user_name} {action_text} {OBJECT_NAMES[event['object_type']]} '{name}'"
+        else:
+            description = f"{user_name} выполнил(а) действие {action_text}"
+
+        folder_id = event['object_id'] if is_folder and event['object_id'] in folders else None
+        project_id = projects.get(event['project_uuid']) if event['project_uuid'] else None
+        if project_id is None:
+            project_id = folders.get(folder_id or event['parent_id'], (None, None))[1]
+
+        logs.append(FolderActionLog(
+            user=user,
+            project_id=project_id,
+            folder_id=folder_id,
+            file_id=event['object_id'] if not is_folder and event['object_id'] in existing_files else None,
+            folder_name=name if is_folder else None,
+            file_name=name if not is_folder else None,
+            action_type=event['action_type'],
+            description=description,
+            created_at=parse_datetime(event['created_at']),
+        ))
+
+    FolderActionLog.objects.bulk_create(logs)
+    return logs
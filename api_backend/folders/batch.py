@@ -0,0 +1,112 @@
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from .blobs import acquire_blob, attach_blob, content_sha256, lock_blobs
+from .media_gc import remove_physical_files
+from .models import File
+from .previews import schedule_previews, supports_preview
+from .rollups import apply_file_deltas
+
+# Максимальное число файлов в одной пакетной операции
+MAX_BATCH_SIZE = 500
+
+
+def _schedule_previews(file_ids):
+    for file_id in file_ids:
+        schedule_previews(file_id)
+
+
+def find_name_conflicts(files, target, exclude_sources=True):
+    """
+    Имена файлов, которые уже есть в целевой папке или повторяются в пакете.
+    При перемещении сами файлы пакета конфликтом не считаются, при копировании
+    (exclude_sources=False) их имена в целевой папке заняты.
+    """
+    names = [file.name for file in files]
+    existing = File.objects.filter(folder=target, name__in=names)
+    if exclude_sources:
+        existing = existing.exclude(id__in=[file.id for file in files])
+    conflicts = set(existing.values_list('name', flat=True))
+    seen = set()
+    for name in names:
+        if name in seen:
+            conflicts.add(name)
+        seen.add(name)
+    return sorted(conflicts)
+
+
+def move_files(files, target):
+    """Переносит файлы в папку одним UPDATE и пересчитывает итоги папок"""
+    files = [file for file in files if file.folder_id != target.id]
+    if not files:
+        return 0
+
+    deltas = defaultdict(lambda: [0, 0])
+    for file in files:
+        deltas[file.folder_id][0] -= file.size
+        deltas[file.folder_id][1] -= 1
+        deltas[target.id][0] += file.size
+        deltas[target.id][1] += 1
+
+    with transaction.atomic():
+        moved = File.objects.filter(id__in=[file.id for file in files]).update(
+            folder=target,
+            updated_at=timezone.now(),
+        )
+        apply_file_deltas(deltas)
+    return moved
+
+
+def delete_files(files):
+    """
+    Удаляет записи одним запросом. Общее содержимое освобождает сборщик
+    блобов, файлы без блоба удаляются с диска после фиксации транзакции.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for file in files:
+        deltas[file.folder_id][0] -= file.size
+        deltas[file.folder_id][1] -= 1
+    paths = [file.file.path for file in files if not file.blob_id and file.file]
+
+    with transaction.atomic():
+        File.objects.filter(id__in=[file.id for file in files]).delete()
+        apply_file_deltas(deltas)
+        transaction.on_commit(lambda: remove_physical_files(paths))
+    return len(files)
+
+
+def copy_files(files, target, user):
+    """
+    Копирует файлы в папку: новые записи ссылаются на те же блобы,
+    байты не копируются. Файлы, сохраненные до появления блобов,
+    переводятся в хранилище блобов при первом копировании.
+    """
+    with transaction.atomic():
+        copies = []
+        shared_blob_ids = []
+        for file in files:
+            copy = File(
+                name=file.name,
+                folder=target,
+                created_by=user,
+                mime_type=file.mime_type,
+                preview_status=file.preview_status,
+            )
+            if file.blob_id:
+                attach_blob(copy, file.blob)
+                shared_blob_ids.append(file.blob_id)
+            else:
+                with file.file.open('rb') as content:
+                    attach_blob(copy, acquire_blob(content_sha256(content), file.size, content=content))
+                if supports_preview(copy.mime_type):
+                    copy.preview_status = 'PENDING'
+            copies.append(copy)
+
+        # Источник могут удалить параллельно: блокировка не дает сборщику забрать общие блобы
+        lock_blobs(shared_blob_ids)
+        File.objects.bulk_create(copies)
+        apply_file_deltas({target.id: (sum(copy.size for copy in copies), len(copies))})
+
+        pending_ids = [copy.id for copy in copies if copy.preview_status == 'PENDING']
+        transaction.on_commit(lambda: _schedule_previews(pending_ids))
+    return copies
@@ -0,0 +1,123 @@
+from datetime import timedelta
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import Blob, File, blob_upload_to
+from .previews import delete_previews
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Блоб без ссылок удаляется не раньше, чем через этот срок после создания
+GC_GRACE_PERIOD = timedelta(hours=1)
+
+
+def content_sha256(content):
+    """SHA-256 загруженного файла, читаемого по частям"""
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def _move_to_storage(path, name):
+    """
+    Переносит временный файл по адресу блоба. Если байты уже на месте,
+    временный файл просто удаляется: по одному адресу лежит одно содержимое.
+    """
+    if default_storage.exists(name):
+        os.remove(path)
+        return
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        file_move_safe(path, target)
+    except FileExistsError:
+        # То же содержимое успела перенести параллельная загрузка
+        os.remove(path)
+
+
+def _store_bytes(name, content=None, path=None):
+    """Кладет содержимое в хранилище по адресу блоба"""
+    if path:
+        # Временный файл переносится после фиксации: при откате он нужен для повтора
+        transaction.on_commit(lambda: _move_to_storage(path, name))
+        return
+    if default_storage.exists(name):
+        return
+    default_storage.save(name, content)
+
+
+def acquire_blob(sha256, size, content=None, path=None):
+    """
+    Возвращает блоб с этим содержимым, заблокировав его строку до конца транзакции.
+    Новые байты записываются только для нового блоба; content - загруженный
+    файл, path - временный файл на диске (переносится без копирования
+    после фиксации транзакции).
+    """
+    name = blob_upload_to(Blob(sha256=sha256), None)
+    while True:
+        blob, created = Blob.objects.get_or_create(
+            sha256=sha256,
+            defaults={'file': name, 'size': size},
+        )
+        if created:
+            _store_bytes(name, content=content, path=path)
+            return blob
+        # Блоб могли удалить между выборкой и блокировкой
+        if lock_blobs([blob.pk]):
+            _store_bytes(blob.file.name, content=content, path=path)
+            return blob
+
+
+def attach_blob(instance, blob):
+    """Привязывает запись File к содержимому"""
+    instance.blob = blob
+    instance.file = blob.file.name
+    instance.sha256 = blob.sha256
+    instance.size = blob.size
+
+
+def lock_blobs(blob_ids):
+    """
+    Блокирует строки блобов до фиксации транзакции: сборщик пропускает
+    заблокированные блобы, а после фиксации видит новые ссылки на них.
+    Возвращает id блобов, которые еще существуют.
+    """
+    return list(Blob.objects.select_for_update().filter(pk__in=blob_ids).values_list('pk', flat=True))
+
+
+def collect_unreferenced_blobs(batch_size=500, grace_period=GC_GRACE_PERIOD):
+    """
+    Удаляет блобы, на которые не ссылается ни один File, вместе с байтами.
+    Отсутствие ссылок проверяется по таблице файлов, поэтому учитываются
+    и каскадные удаления папок и проектов.
+    """
+    cutoff = timezone.now() - grace_period
+    removed = 0
+    while True:
+        with transaction.atomic():
+            blobs = list(
+                Blob.objects.select_for_update(skip_locked=True)
+                .filter(created_at__lt=cutoff)
+                .filter(~Exists(File.objects.filter(blob=OuterRef('pk'))))
+                .order_by('pk')[:batch_size]
+            )
+            if not blobs:
+                break
+            Blob.objects.filter(pk__in=[blob.pk for blob in blobs]).delete()
+            # Байты удаляются под блокировкой строк: параллельная загрузка
+            # того же содержимого дождется удаления и запишет их заново
+            for blob in blobs:
+                try:
+                    default_storage.delete(blob.file.name)
+                except OSError as e:
+                    logger.warning(f"Failed to delete blob {blob.sha256}: {str(e)}")
+                delete_previews(blob.sha256)
+        removed += len(blobs)
+    return removed
@@ -0,0 +1,204 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import Q
+from django.urls import reverse
+from operator import itemgetter
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from .models import Folder, File
+from .previews import PREVIEW_SIZES
+
+# Поля ответов совпадают с FileSerializer и FolderSerializer
+FILE_FIELDS = [
+    'id', 'name', 'folder', 'file', 'download_url', 'previews', 'preview_status', 'created_at',
+    'updated_at', 'created_by', 'size', 'mime_type', 'sha256',
+]
+FOLDER_FIELDS = [
+    'id', 'name', 'folder_type', 'project', 'project_uuid', 'parent', 'created_at', 'updated_at',
+    'created_by', 'direct_size', 'direct_file_count', 'subtree_size', 'subtree_file_count', 'files', 'children',
+]
+
+# Вложенные поля папки, которые требуют загруженного дерева
+NESTED_FIELDS = ['files', 'children']
+
+FILE_COLUMNS = [
+    'id', 'name', 'folder_id', 'file', 'size', 'mime_type', 'sha256', 'preview_status',
+    'created_at', 'updated_at', 'created_by_id',
+]
+FOLDER_COLUMNS = [
+    'id', 'name', 'folder_type', 'parent_id', 'created_at', 'updated_at', 'created_by_id',
+    'direct_size', 'direct_file_count', 'subtree_size', 'subtree_file_count',
+]
+
+
+def parse_fields(request, allowed):
+    """
+    Набор полей из ?fields=id,name,children. Без параметра возвращаются все поля.
+    Для вложенных файлов действуют те же имена полей.
+    """
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    fields = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = fields - set(allowed)
+    if unknown:
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+    return fields
+
+
+class FileRowRenderer:
+    """
+    Сериализация файлов из строк values() без экземпляров моделей и сериализаторов.
+    Префиксы адресов и набор полей вычисляются один раз на запрос.
+    """
+
+    def __init__(self, fields=None):
+        # Адреса скачивания и превью строятся подстановкой id в шаблон маршрута
+        marker = 987654321
+        download_url = f"{settings.MEDIA_HOST}{reverse('file-download', kwargs={'pk': marker})}"
+        self.download_prefix, self.download_suffix = download_url.split(str(marker))
+        self.preview_templates = {
+            size: f"{settings.MEDIA_HOST}{reverse('file-preview', kwargs={'pk': marker, 'size': size})}".split(str(marker))
+            for size in PREVIEW_SIZES
+        }
+        self.datetime_field = serializers.DateTimeField()
+
+        getters = {
+            'id': itemgetter('id'),
+            'name': itemgetter('name'),
+            'folder': itemgetter('folder_id'),
+            'file': self.file_url,
+            'download_url': self.download_url,
+            'previews': self.previews,
+            'preview_status': itemgetter('preview_status'),
+            'created_at': lambda row: self.datetime_field.to_representation(row['created_at']),
+            'updated_at': lambda row: self.datetime_field.to_representation(row['updated_at']),
+            'created_by': itemgetter('created_by_id'),
+            'size': itemgetter('size'),
+            'mime_type': itemgetter('mime_type'),
+            'sha256': itemgetter('sha256'),
+        }
+        self.getters = [(field, getters[field]) for field in FILE_FIELDS if fields is None or field in fields]
+
+    def file_url(self, row):
+        return self.download_url(row) if row['file'] else None
+
+    def download_url(self, row):
+        return f"{self.download_prefix}{row['id']}{self.download_suffix}"
+
+    def previews(self, row):
+        if row['preview_status'] != 'READY' or not row['sha256']:
+            return {}
+        return {size: f"{prefix}{row['id']}{suffix}" for size, (prefix, suffix) in self.preview_templates.items()}
+
+    def render(self, row):
+        return {field: getter(row) for field, getter in self.getters}
+
+    def render_many(self, rows):
+        return [self.render(row) for row in rows]
+
+
+class FolderRowRenderer:
+    """Сериализация папок из строк values(), без вложенных файлов и подпапок"""
+
+    def __init__(self, project, fields=None):
+        self.file_renderer = FileRowRenderer(None if fields is None else fields & set(FILE_FIELDS))
+        to_datetime = self.file_renderer.datetime_field.to_representation
+        project_name, project_uuid = str(project), str(project.uuid)
+
+        getters = {
+            'project': lambda row: project_name,
+            'project_uuid': lambda row: project_uuid,
+            'parent': itemgetter('parent_id'),
+            'created_by': itemgetter('created_by_id'),
+            'created_at': lambda row: to_datetime(row['created_at']),
+            'updated_at': lambda row: to_datetime(row['updated_at']),
+            **self.get_nested_getters(),
+        }
+        self.getters = [
+            (field, getters.get(field, itemgetter(field)))
+            for field in FOLDER_FIELDS
+            if (fields is None or field in fields) and (field in getters or field not in NESTED_FIELDS)
+        ]
+
+    def get_nested_getters(self):
+        return {}
+
+    def render(self, row):
+        return {field: getter(row) for field, getter in self.getters}
+
+    def render_many(self, rows):
+        return [self.render(row) for row in rows]
+
+
+class FolderTreeRenderer(FolderRowRenderer):
+    """
+    Дерево папок проекта из двух запросов values() (папки и, если нужны, файлы),
+    собираемое в словари в памяти.
+    """
+
+    def __init__(self, project, fields=None):
+        super().__init__(project, fields)
+
+        self.folders = {}
+        self._children = defaultdict(list)
+        for row in Folder.objects.filter(project=project).values(*FOLDER_COLUMNS):
+            self.folders[row['id']] = row
+            self._children[row['parent_id']].append(row)
+
+        self._files = defaultdict(list)
+        if fields is None or 'files' in fields:
+            for row in File.objects.filter(folder__project=project).values(*FILE_COLUMNS):
+                self._files[row['folder_id']].append(row)
+
+    def get_nested_getters(self):
+        return {
+            'files': lambda row: self.file_renderer.render_many(self._files.get(row['id'], [])),
+            'children': lambda row: [self.render(child) for child in self._children.get(row['id'], [])],
+        }
+
+    def render_ids(self, folder_ids):
+        """Папки дерева по списку id с сохранением порядка"""
+        return [self.render(self.folders[folder_id]) for folder_id in folder_ids if folder_id in self.folders]
+
+
+def split_folder_path(value):
+    """Сегменты пути вида 'WORKING/АР/Стадия П' без пустых частей"""
+    segments = [segment.strip() for segment in (value or '').split('/') if segment.strip()]
+    if not segments:
+        raise ValidationError({'path': "Path is required"})
+    if len(segments) > Folder.MAX_DEPTH + 1:
+        raise ValidationError({'path': f"Path is deeper than {Folder.MAX_DEPTH + 1} levels"})
+    return segments
+
+
+def resolve_folder_path(queryset, segments):
+    """
+    Находит папку по пути от корневой папки одним запросом: выбираются только
+    кандидаты с нужным именем на каждой глубине, цепочка проверяется в памяти.
+    Первый сегмент - тип корневой папки (WORKING) или ее название.
+    Возвращает строки values() папки и ее предков или None.
+    """
+    condition = Q(depth=0) & (Q(folder_type=segments[0]) | Q(name=segments[0]))
+    for depth, name in enumerate(segments[1:], start=1):
+        condition |= Q(depth=depth, name=name)
+
+    levels = defaultdict(list)
+    for row in queryset.filter(condition).order_by('depth', 'id').values(*FOLDER_COLUMNS, 'depth'):
+        levels[row['depth']].append(row)
+
+    # Совпадение по типу корневой папки приоритетнее совпадения по названию
+    roots = sorted(levels[0], key=lambda row: row['folder_type'] != segments[0])
+    for root in roots:
+        chain = [root]
+        for depth, name in enumerate(segments[1:], start=1):
+            row = next(
+                (row for row in levels[depth] if row['parent_id'] == chain[-1]['id'] and row['name'] == name),
+                None,
+            )
+            if row is None:
+                break
+            chain.append(row)
+        else:
+            return chain
+    return None
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from folders.models import FolderActionLog
+from folders.retention import archive_action_logs, get_retention_cutoff, get_archive_dir
+
+
+class Command(BaseCommand):
+    help = 'Move folder action log entries older than the retention period to compressed JSONL archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Срок хранения в днях (по умолчанию из настроек)')
+        parser.add_argument('--archive-dir', help='Каталог архивов (по умолчанию из настроек)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = get_retention_cutoff(options['days'])
+
+        if options['dry_run']:
+            count = FolderActionLog.objects.filter(created_at__lt=cutoff).count()
+            self.stdout.write(f"Записей старше {cutoff:%Y-%m-%d}: {count}")
+            return
+
+        archive_dir = options['archive_dir'] or get_archive_dir()
+        archived = archive_action_logs(cutoff, archive_dir, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено в архив {archived} записей в {archive_dir}"
+        ))
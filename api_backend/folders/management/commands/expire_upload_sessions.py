@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from folders.models import UploadSession
+from folders.uploads import expire_upload_sessions, get_session_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Remove abandoned chunked upload sessions and their temporary files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='Срок без новых частей в часах (по умолчанию из настроек)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = get_session_cutoff(options['hours'])
+
+        if options['dry_run']:
+            count = UploadSession.objects.filter(updated_at__lt=cutoff).count()
+            self.stdout.write(f"Загрузок без изменений с {cutoff:%Y-%m-%d %H:%M}: {count}")
+            return
+
+        sessions, files = expire_upload_sessions(cutoff, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено загрузок: {sessions}, временных файлов: {files}"
+        ))
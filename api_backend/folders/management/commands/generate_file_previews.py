@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from folders.models import File
+from folders.previews import generate_previews, schedule_previews
+
+
+class Command(BaseCommand):
+    help = 'Generate missing previews for uploaded images and PDFs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', dest='statuses',
+                            help='Статусы превью для обработки (по умолчанию PENDING и FAILED)')
+        parser.add_argument('--sync', action='store_true', help='Создавать превью в этом процессе, а не в Celery')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        statuses = options['statuses'] or ['PENDING', 'FAILED']
+        queryset = File.objects.filter(preview_status__in=statuses).exclude(sha256='').order_by('id')
+
+        if options['dry_run']:
+            self.stdout.write(f"Файлов без превью: {queryset.count()}")
+            return
+
+        count = 0
+        for file in queryset.iterator():
+            if options['sync']:
+                generate_previews(file)
+            else:
+                schedule_previews(file.id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Обработано файлов: {count}"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from projects.models import Project
+from folders.models import Folder
+
+
+class Command(BaseCommand):
+    help = 'Create the default folder structure for projects that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', default='in_progress',
+            help='Статус проектов, для которых создаются папки (по умолчанию in_progress)',
+        )
+        parser.add_argument(
+            '--project', action='append', dest='projects', default=[],
+            help='UUID проекта; можно указать несколько раз',
+        )
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.filter(status=options['status']).exclude(
+            Exists(Folder.objects.filter(project=OuterRef('pk'), parent=None))
+        ).select_related('gip').order_by('id')
+        if options['projects']:
+            projects = projects.filter(uuid__in=options['projects'])
+
+        project_ids = list(projects.values_list('id', flat=True))
+        if options['dry_run']:
+            self.stdout.write(f"Проектов без структуры папок: {len(project_ids)}")
+            return
+
+        batch_size = options['batch_size']
+        folders_created = 0
+        for start in range(0, len(project_ids), batch_size):
+            batch = list(projects.filter(id__in=project_ids[start:start + batch_size]))
+            folders_created += len(Folder.create_default_structures(batch))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано {folders_created} папок для {len(project_ids)} проектов"
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from projects.models import Project
+from folders.models import Folder
+from folders.rollups import recompute_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute folder size and file count rollups from the files table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project', action='append', dest='projects', default=[],
+            help='UUID проекта; можно указать несколько раз (по умолчанию все проекты с папками)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['projects']:
+            project_ids = list(Project.objects.filter(uuid__in=options['projects']).values_list('id', flat=True))
+        else:
+            project_ids = list(Folder.objects.values_list('project_id', flat=True).distinct().order_by('project_id'))
+
+        # Каждый проект пересчитывается в своей транзакции
+        changed = 0
+        for project_id in project_ids:
+            changed += recompute_rollups(project_id, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено проектов: {len(project_ids)}, исправлено папок: {changed}"
+        ))
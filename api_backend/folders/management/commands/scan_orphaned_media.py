@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from folders.media_gc import DEFAULT_GRACE_HOURS, DEFAULT_SCAN_ROOTS, iter_missing_files, scan_orphaned_media
+
+
+class Command(BaseCommand):
+    help = 'Find files in media storage that no database row references, and rows whose files are missing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root', action='append', dest='roots', default=[],
+            help=f"Каталог внутри MEDIA_ROOT; можно указать несколько раз (по умолчанию {', '.join(DEFAULT_SCAN_ROOTS)})",
+        )
+        parser.add_argument('--quarantine', help='Переносить найденные файлы в этот каталог вместо удаления')
+        parser.add_argument('--workers', type=int, default=4, help='Число потоков обхода')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--grace-hours', type=int, default=DEFAULT_GRACE_HOURS,
+                            help='Не трогать файлы моложе указанного срока')
+        parser.add_argument('--skip-missing', action='store_true', help='Не проверять записи без файлов')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        report = self.stdout.write if options['verbosity'] > 1 or options['dry_run'] else None
+        stats = scan_orphaned_media(
+            roots=options['roots'] or None,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            grace_hours=options['grace_hours'],
+            quarantine_dir=options['quarantine'],
+            dry_run=options['dry_run'],
+            report=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено файлов: {stats['scanned']}, без ссылок: {stats['orphaned']} "
+            f"({stats['orphaned_bytes']} байт), удалено: {stats['removed']}, "
+            f"в карантине: {stats['quarantined']}, ошибок: {stats['errors']}"
+        ))
+
+        if options['skip_missing']:
+            return
+        missing = 0
+        for file_id, name in iter_missing_files(options['batch_size']):
+            missing += 1
+            self.stdout.write(self.style.WARNING(f"Нет файла для записи {file_id}: {name}"))
+        self.stdout.write(f"Записей без файлов: {missing}")
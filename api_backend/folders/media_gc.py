@@ -0,0 +1,166 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+from .models import Blob, File
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+# Каталоги хранилища, в которых лежат файлы проектов, блобы и превью
+DEFAULT_SCAN_ROOTS = ['project_files', 'blobs', 'previews']
+
+# Файлы моложе этого срока не трогаем: их запись в базе может быть еще не зафиксирована
+DEFAULT_GRACE_HOURS = 24
+
+
+def remove_physical_files(paths):
+    """Удаляет файлы с диска; вызывается после фиксации транзакции"""
+    for path in paths:
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to delete file {path}: {str(e)}")
+
+
+def iter_media_files(directory, recursive=True):
+    """Обход каталога через os.scandir без построения списка всех файлов"""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def get_scan_shards(media_root, roots):
+    """
+    Делит обход на независимые части для потоков: файлы в корне каталога
+    и каждый его подкаталог (project_files/2024, blobs/ab, ...).
+    """
+    shards = []
+    for root in roots:
+        path = os.path.join(media_root, root)
+        if not os.path.isdir(path):
+            continue
+        shards.append((path, False))
+        with os.scandir(path) as entries:
+            shards.extend((entry.path, True) for entry in entries if entry.is_dir(follow_symlinks=False))
+    return shards
+
+
+def find_referenced(names):
+    """Какие из путей хранилища используются: файлы и блобы по пути, превью по хэшу"""
+    referenced = set(File.objects.filter(file__in=names).values_list('file', flat=True))
+    referenced |= set(Blob.objects.filter(file__in=names).values_list('file', flat=True))
+
+    previews = {}
+    for name in names:
+        if name.startswith('previews/'):
+            previews.setdefault(os.path.basename(name).split('_')[0], []).append(name)
+    if previews:
+        hashes = set(Blob.objects.filter(sha256__in=list(previews)).values_list('sha256', flat=True))
+        hashes |= set(File.objects.filter(sha256__in=list(previews)).values_list('sha256', flat=True))
+        for sha256 in hashes:
+            referenced.update(previews[sha256])
+    return referenced
+
+
+def _dispose(path, name, quarantine_dir):
+    if quarantine_dir:
+        target = os.path.join(quarantine_dir, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+    else:
+        os.remove(path)
+
+
+def scan_shard(media_root, directory, recursive, batch_size=1000, grace_hours=DEFAULT_GRACE_HOURS,
+               quarantine_dir=None, dry_run=False, report=None):
+    """
+    Проверяет файлы части хранилища пачками по batch_size путей
+    и удаляет (или переносит в карантин) те, на которые нет ссылок в базе.
+    """
+    stats = Counter()
+    cutoff = time.time() - grace_hours * 3600
+
+    def process(batch):
+        referenced = find_referenced([name for name, _, _ in batch])
+        for name, path, size in batch:
+            if name in referenced:
+                continue
+            stats['orphaned'] += 1
+            stats['orphaned_bytes'] += size
+            if report:
+                report(name)
+            if dry_run:
+                continue
+            try:
+                _dispose(path, name, quarantine_dir)
+                stats['quarantined' if quarantine_dir else 'removed'] += 1
+            except OSError as e:
+                stats['errors'] += 1
+                logger.warning(f"Failed to dispose orphaned file {name}: {str(e)}")
+
+    try:
+        batch = []
+        for entry in iter_media_files(directory, recursive):
+            stats['scanned'] += 1
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                stats['skipped_recent'] += 1
+                continue
+            name = os.path.relpath(entry.path, media_root).replace(os.sep, '/')
+            batch.append((name, entry.path, stat.st_size))
+            if len(batch) >= batch_size:
+                process(batch)
+                batch = []
+        if batch:
+            process(batch)
+    finally:
+        # Поток открывает собственное соединение с базой
+        connections.close_all()
+    return stats
+
+
+def scan_orphaned_media(roots=None, workers=4, batch_size=1000, grace_hours=DEFAULT_GRACE_HOURS,
+                        quarantine_dir=None, dry_run=False, report=None):
+    """Параллельный обход хранилища: каждый поток проверяет свою часть каталогов"""
+    media_root = str(settings.MEDIA_ROOT)
+    shards = get_scan_shards(media_root, roots or DEFAULT_SCAN_ROOTS)
+    stats = Counter()
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [
+            executor.submit(
+                scan_shard, media_root, directory, recursive,
+                batch_size=batch_size,
+                grace_hours=grace_hours,
+                quarantine_dir=quarantine_dir,
+                dry_run=dry_run,
+                report=report,
+            )
+            for directory, recursive in shards
+        ]
+        for future in futures:
+            stats.update(future.result())
+    return stats
+
+
+def iter_missing_files(batch_size=2000):
+    """Записи File, файлов которых нет в хранилище: (id, путь). Читаются потоком по ключу"""
+    media_root = str(settings.MEDIA_ROOT)
+    files = File.objects.exclude(file='').order_by('id').values_list('id', 'file')
+    for file_id, name in files.iterator(chunk_size=batch_size):
+        if not os.path.exists(os.path.join(media_root, name)):
+            yield file_id, name
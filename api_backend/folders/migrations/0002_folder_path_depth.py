@@ -0,0 +1,49 @@
+# Generated by Django 5.1.2 on 2026-10-17 15:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_folder_paths(apps, schema_editor):
+    Folder = apps.get_model('folders', 'Folder')
+    parents = dict(Folder.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def build_path(folder_id):
+        if folder_id not in paths:
+            parent_id = parents[folder_id]
+            paths[folder_id] = f"{build_path(parent_id)}{parent_id}/" if parent_id else ''
+        return paths[folder_id]
+
+    folders = []
+    for folder_id in parents:
+        path = build_path(folder_id)
+        folders.append(Folder(id=folder_id, path=path, depth=path.count('/')))
+    Folder.objects.bulk_update(folders, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0001_initial'),
+        ('projects', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_folder_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['path'], name='folder_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
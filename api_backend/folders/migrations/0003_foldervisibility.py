@@ -0,0 +1,61 @@
+# Generated by Django 5.1.2 on 2026-10-17 15:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_folder_visibility(apps, schema_editor):
+    Project = apps.get_model('projects', 'Project')
+    ProjectMember = apps.get_model('projects', 'ProjectMember')
+    Folder = apps.get_model('folders', 'Folder')
+    FolderAccess = apps.get_model('folders', 'FolderAccess')
+    FolderVisibility = apps.get_model('folders', 'FolderVisibility')
+
+    rows = [
+        FolderVisibility(user_id=user_id, project_id=project_id, source='GIP')
+        for project_id, user_id in Project.objects.values_list('id', 'gip__user_id')
+    ]
+    rows += [
+        FolderVisibility(user_id=user_id, project_id=project_id, source='MEMBER')
+        for project_id, user_id in ProjectMember.objects.values_list('project_id', 'member__user_id')
+    ]
+    rows += [
+        FolderVisibility(user_id=user_id, project_id=project_id, folder_id=folder_id, source='ACCESS')
+        for user_id, project_id, folder_id in FolderAccess.objects.values_list('user_id', 'folder__project_id', 'folder_id')
+    ]
+    rows += [
+        FolderVisibility(user_id=user_id, project_id=project_id, folder_id=folder_id, source='OWNER')
+        for user_id, project_id, folder_id in Folder.objects.filter(
+            created_by__isnull=False
+        ).values_list('created_by_id', 'project_id', 'id')
+    ]
+    FolderVisibility.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0002_folder_path_depth'),
+        ('projects', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderVisibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('MEMBER', 'Участник проекта'), ('GIP', 'ГИП проекта'), ('ACCESS', 'Доступ к папке'), ('OWNER', 'Автор папки')], max_length=10)),
+                ('folder', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visibility', to='folders.folder')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='folder_visibility', to='projects.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='folder_visibility', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Видимость папки',
+                'verbose_name_plural': 'Видимость папок',
+                'constraints': [models.UniqueConstraint(fields=('user', 'project', 'folder', 'source'), name='unique_folder_visibility', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(fill_folder_visibility, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-17 15:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0003_foldervisibility'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='folderactionlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
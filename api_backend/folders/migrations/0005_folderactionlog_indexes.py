@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-17 15:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0004_folderactionlog_created_at'),
+        ('projects', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='folderactionlog',
+            index=models.Index(fields=['project', '-created_at', '-id'], name='folder_log_project_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folderactionlog',
+            index=models.Index(fields=['project', 'action_type', '-created_at', '-id'], name='folder_log_project_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folderactionlog',
+            index=models.Index(fields=['-created_at', '-id'], name='folder_log_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0007_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='preview_status',
+            field=models.CharField(blank=True, choices=[('PENDING', 'Создаются'), ('READY', 'Готовы'), ('FAILED', 'Ошибка'), ('UNSUPPORTED', 'Не поддерживается')], max_length=12),
+        ),
+    ]
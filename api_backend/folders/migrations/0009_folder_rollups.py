@@ -0,0 +1,68 @@
+# Generated by Django 5.1.2 on 2026-10-17 15:52
+
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_folder_rollups(apps, schema_editor):
+    Folder = apps.get_model('folders', 'Folder')
+    File = apps.get_model('folders', 'File')
+    direct = {
+        row['folder_id']: (row['size'] or 0, row['count'])
+        for row in File.objects.values('folder_id').annotate(size=Sum('size'), count=Count('id')).order_by()
+    }
+    paths = dict(Folder.objects.values_list('id', 'path'))
+    totals = defaultdict(lambda: [0, 0])
+    for folder_id, path in paths.items():
+        size, count = direct.get(folder_id, (0, 0))
+        for target_id in [*(int(item) for item in path.split('/') if item), folder_id]:
+            totals[target_id][0] += size
+            totals[target_id][1] += count
+
+    folders = []
+    for folder_id in paths:
+        direct_size, direct_count = direct.get(folder_id, (0, 0))
+        folders.append(Folder(
+            id=folder_id,
+            direct_size=direct_size,
+            direct_file_count=direct_count,
+            subtree_size=totals[folder_id][0],
+            subtree_file_count=totals[folder_id][1],
+        ))
+    Folder.objects.bulk_update(
+        folders,
+        ['direct_size', 'direct_file_count', 'subtree_size', 'subtree_file_count'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0008_file_preview_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='direct_file_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='direct_size',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='subtree_file_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='subtree_size',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_folder_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-17 15:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0009_folder_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['folder', 'updated_at'], name='file_folder_updated_idx'),
+        ),
+    ]
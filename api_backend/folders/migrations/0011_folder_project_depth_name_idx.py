@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-17 16:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0010_file_folder_updated_idx'),
+        ('projects', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['project', 'depth', 'name'], name='folder_project_depth_name_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folders', '0011_folder_project_depth_name_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='blob',
+            name='ref_count',
+        ),
+    ]
@@ -1,6 +1,14 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from projects.models import Project
+from collections import defaultdict
+import mimetypes
+import os
+import uuid
 
 User = get_user_model()
 
@@ -22,10 +30,21 @@ class Folder(models.Model):
         ('ADMIN', 'Полный доступ'),
     ]
 
+    # Максимальная глубина вложенности (корневые папки имеют глубину 0)
+    MAX_DEPTH = 5
+
     name = models.CharField(max_length=50)
     folder_type = models.CharField(max_length=20, choices=FOLDER_TYPES, null=True, blank=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='folders')
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='children')
+    # Материализованный путь: id предков через '/', например '1/5/' (пусто у корневых)
+    path = models.CharField(max_length=255, default='', blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Итоги по файлам: самой папки и всего поддерева (поддерживаются при изменении файлов)
+    direct_size = models.BigIntegerField(default=0, editable=False)
+    direct_file_count = models.PositiveIntegerField(default=0, editable=False)
+    subtree_size = models.BigIntegerField(default=0, editable=False)
+    subtree_file_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_folders')
@@ -36,6 +55,8 @@ class Folder(models.Model):
         indexes = [
             models.Index(fields=['folder_type', 'project']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['path'], name='folder_path_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['project', 'depth', 'name'], name='folder_project_depth_name_idx'),
         ]
         verbose_name = 'Папка'
         verbose_name_plural = 'Папки'
@@ -43,29 +64,129 @@ class Folder(models.Model):
     def __str__(self):
         return f"{self.name} - {self.project.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходного родителя, чтобы при сохранении пересчитать путь поддерева
+        if 'parent_id' in instance.__dict__:
+            instance._loaded_parent_id = instance.parent_id
+        return instance
+
+    @property
+    def subtree_path(self):
+        """Префикс пути всех потомков папки"""
+        return f"{self.path}{self.id}/"
+
+    def get_ancestor_ids(self):
+        return [int(folder_id) for folder_id in self.path.split('/') if folder_id]
+
+    def get_ancestors(self):
+        """Все предки папки одним запросом по первичному ключу"""
+        return Folder.objects.filter(id__in=self.get_ancestor_ids())
+
+    def get_descendants(self):
+        """Все потомки папки одним запросом по индексу пути"""
+        return Folder.objects.filter(path__startswith=self.subtree_path)
+
+    def is_descendant_of(self, folder):
+        return self.path.startswith(folder.subtree_path)
+
+    def save(self, *args, **kwargs):
+        from .rollups import move_subtree
+
+        adding = self._state.adding
+        parent_changed = not adding and self.parent_id != self.__dict__.get('_loaded_parent_id', self.parent_id)
+        old_subtree_path = None if adding else self.subtree_path
+        old_ancestor_ids = self.get_ancestor_ids()
+        old_depth = self.depth
+
+        if adding or parent_changed:
+            self.path = self.parent.subtree_path if self.parent else ''
+            self.depth = self.parent.depth + 1 if self.parent else 0
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'path', 'depth'}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if parent_changed:
+                # Переносим путь всего поддерева одним UPDATE
+                Folder.objects.filter(path__startswith=old_subtree_path).update(
+                    path=Concat(
+                        Value(self.subtree_path),
+                        Substr('path', len(old_subtree_path) + 1),
+                        output_field=models.CharField(),
+                    ),
+                    depth=F('depth') + (self.depth - old_depth),
+                )
+                move_subtree(self.pk, old_ancestor_ids, self.get_ancestor_ids())
+        self._loaded_parent_id = self.parent_id
+
     @classmethod
     def create_default_structure(cls, project):
         """Создает структуру папок по умолчанию для проекта"""
-        root_folders = []
-        for folder_type, folder_name in cls.FOLDER_TYPES:
-            folder = cls.objects.create(
-                name=folder_name,
-                folder_type=folder_type,
-                project=project,
-                parent=None
-            )
-            # Даем полный доступ ГИПу к каждой созданной папке
-            if project.gip and project.gip.user:
-                FolderAccess.objects.create(
+        return cls.create_default_structures([project])
+
+    @classmethod
+    def create_default_structures(cls, projects):
+        """
+        Создает структуру папок по умолчанию для нескольких проектов:
+        одна вставка папок и одна вставка прав ГИПа в одной транзакции
+        """
+        from .visibility import grant_folder_visibility
+
+        gip_users = {project.id: project.gip.user_id for project in projects if project.gip_id}
+        with transaction.atomic():
+            root_folders = cls.objects.bulk_create([
+                cls(name=folder_name, folder_type=folder_type, project=project, parent=None)
+                for project in projects
+                for folder_type, folder_name in cls.FOLDER_TYPES
+            ])
+            # Даем полный доступ ГИПу к каждой созданной папке (ГИП сам себе дает права)
+            accesses = [
+                FolderAccess(
                     folder=folder,
-                    user=project.gip.user,
+                    user_id=gip_users[folder.project_id],
                     access_level='ADMIN',
-                    granted_by=project.gip.user  # ГИП м себе дает права
+                    granted_by_id=gip_users[folder.project_id],
                 )
-            root_folders.append(folder)
+                for folder in root_folders
+                if folder.project_id in gip_users
+            ]
+            FolderAccess.objects.bulk_create(accesses)
+            grant_folder_visibility(
+                [(access.user_id, access.folder.project_id, access.folder.id) for access in accesses],
+                'ACCESS',
+            )
         return root_folders
 
+def blob_upload_to(instance, filename):
+    return f"blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}"
+
+class Blob(models.Model):
+    """
+    Содержимое файла, хранимое один раз по SHA-256. Записи File с одинаковым
+    содержимым ссылаются на один Blob; блобы без ссылок удаляет фоновая задача.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Содержимое файла'
+        verbose_name_plural = 'Содержимое файлов'
+
+    def __str__(self):
+        return f"{self.sha256} ({self.size})"
+
 class File(models.Model):
+    PREVIEW_STATUSES = [
+        ('PENDING', 'Создаются'),
+        ('READY', 'Готовы'),
+        ('FAILED', 'Ошибка'),
+        ('UNSUPPORTED', 'Не поддерживается'),
+    ]
+
     name = models.CharField(max_length=255)
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='files')
     file = models.FileField(upload_to='project_files/%Y/%m/%d/')
@@ -74,21 +195,114 @@ class File(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='uploaded_files')
     size = models.BigIntegerField(default=0)
     mime_type = models.CharField(max_length=255, blank=True)
+    # SHA-256 содержимого (hex), считается при загрузке по частям
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    # Общее содержимое; file указывает на тот же путь в хранилище
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='files')
+    preview_status = models.CharField(max_length=12, choices=PREVIEW_STATUSES, blank=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Исходные папка и размер нужны для пересчета итогов папок при сохранении
+        instance._loaded_rollup = (instance.__dict__.get('folder_id'), instance.__dict__.get('size'))
+        return instance
 
     def save(self, *args, **kwargs):
+        from .previews import supports_preview, schedule_previews
+        from .rollups import apply_file_deltas
+
         if self.file:
-            self.size = self.file.size
-            self.mime_type = self.file.content_type if hasattr(self.file, 'content_type') else ''
-        super().save(*args, **kwargs)
+            # Размер содержимого блоба уже известен, а байты новой загрузки
+            # попадают в хранилище только после фиксации транзакции
+            if not self.blob_id:
+                self.size = self.file.size
+            if not self.mime_type:
+                self.mime_type = mimetypes.guess_type(self.name or self.file.name)[0] or ''
+
+        # Превью создаются в фоне после фиксации транзакции, запрос их не ждет
+        adding = self._state.adding
+        needs_previews = adding and self.sha256 and supports_preview(self.mime_type)
+        if needs_previews:
+            self.preview_status = 'PENDING'
+
+        old_folder_id, old_size = (None, 0) if adding else self.__dict__.get('_loaded_rollup', (None, None))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                apply_file_deltas({self.folder_id: (self.size, 1)})
+            elif old_folder_id is not None and (old_folder_id, old_size) != (self.folder_id, self.size):
+                # Перенос в другую папку или замена содержимого
+                deltas = defaultdict(lambda: [0, 0])
+                deltas[old_folder_id][0] -= old_size
+                deltas[old_folder_id][1] -= 1
+                deltas[self.folder_id][0] += self.size
+                deltas[self.folder_id][1] += 1
+                apply_file_deltas(deltas)
+        self._loaded_rollup = (self.folder_id, self.size)
+
+        if needs_previews:
+            transaction.on_commit(lambda: schedule_previews(self.pk))
+
+    def delete(self, *args, **kwargs):
+        from .rollups import apply_file_deltas
+
+        folder_id, size = self.folder_id, self.size
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            apply_file_deltas({folder_id: (-size, -1)})
+        return result
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['folder', 'updated_at'], name='file_folder_updated_idx'),
+        ]
         verbose_name = 'Файл'
         verbose_name_plural = 'Файлы'
 
     def __str__(self):
         return self.name
 
+class UploadSession(models.Model):
+    """
+    Загрузка файла по частям. Части дописываются во временный файл
+    по смещению, после завершения файл переносится в хранилище
+    и создается запись File.
+    """
+    STATUSES = [
+        ('ACTIVE', 'Загружается'),
+        ('COMPLETED', 'Завершена'),
+    ]
+
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='upload_sessions')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    name = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField()
+    # Сколько байт уже записано; следующая часть должна начинаться с этого смещения
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUSES, default='ACTIVE')
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Загрузка файла'
+        verbose_name_plural = 'Загрузки файлов'
+
+    def __str__(self):
+        return f"{self.name} ({self.offset}/{self.size})"
+
+    @staticmethod
+    def get_temp_dir():
+        return str(getattr(settings, 'FILE_UPLOAD_SESSION_DIR', os.path.join(settings.BASE_DIR, 'upload_sessions')))
+
+    @property
+    def temp_path(self):
+        return os.path.join(self.get_temp_dir(), f"{self.uuid}.part")
+
 class FolderAccess(models.Model):
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='access_rights')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -104,6 +318,38 @@ class FolderAccess(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.folder.name} ({self.get_access_level_display()})"
 
+class FolderVisibility(models.Model):
+    """
+    Денормализованный индекс видимости папок и файлов.
+    Строка без папки открывает пользователю весь проект (участник, ГИП),
+    строка с папкой - только эту папку (явный доступ, автор папки).
+    """
+    SOURCES = [
+        ('MEMBER', 'Участник проекта'),
+        ('GIP', 'ГИП проекта'),
+        ('ACCESS', 'Доступ к папке'),
+        ('OWNER', 'Автор папки'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folder_visibility')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='folder_visibility')
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, null=True, blank=True, related_name='visibility')
+    source = models.CharField(max_length=10, choices=SOURCES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'project', 'folder', 'source'],
+                nulls_distinct=False,
+                name='unique_folder_visibility',
+            ),
+        ]
+        verbose_name = 'Видимость папки'
+        verbose_name_plural = 'Видимость папок'
+
+    def __str__(self):
+        return f"{self.user_id} - {self.project_id} - {self.folder_id or '*'} ({self.source})"
+
 class FolderActionLog(models.Model):
     ACTION_TYPES = [
         ('CREATE', 'Создание'),
@@ -132,10 +378,16 @@ class FolderActionLog(models.Model):
     file_name = models.CharField(max_length=255, null=True, blank=True)
     action_type = models.CharField(max_length=20, choices=ACTION_TYPES)
     description = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Время события, а не вставки: журнал пишется пачками в фоне
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['project', '-created_at', '-id'], name='folder_log_project_idx'),
+            models.Index(fields=['project', 'action_type', '-created_at', '-id'], name='folder_log_project_type_idx'),
+            models.Index(fields=['-created_at', '-id'], name='folder_log_created_idx'),
+        ]
         verbose_name = 'Лог действий с папкой'
         verbose_name_plural = 'Логи действий с папками'
 
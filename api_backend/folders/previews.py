@@ -0,0 +1,132 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.urls import reverse
+from PIL import Image, ImageOps
+from .models import File
+import io
+import logging
+import os
+import subprocess
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Размеры превью: наибольшая сторона в пикселях
+PREVIEW_SIZES = {
+    'small': 200,
+    'medium': 800,
+    'large': 1600,
+}
+
+PDF_TYPES = ('application/pdf',)
+# Векторные и многослойные форматы Pillow не отрисует
+UNSUPPORTED_IMAGE_TYPES = ('image/svg+xml', 'image/vnd.dwg', 'image/x-dwg')
+
+PDFTOPPM_TIMEOUT = 60
+
+
+def supports_preview(mime_type):
+    if not mime_type:
+        return False
+    if mime_type in PDF_TYPES:
+        return True
+    return mime_type.startswith('image/') and mime_type not in UNSUPPORTED_IMAGE_TYPES
+
+
+def preview_name(sha256, size):
+    """Путь превью в хранилище: по хэшу содержимого, общий для одинаковых файлов"""
+    return f"previews/{sha256[:2]}/{sha256[2:4]}/{sha256}_{size}.jpg"
+
+
+def preview_urls(file):
+    """
+    Адреса готовых превью без обращения к базе и хранилищу. Превью отдаются
+    через приложение с проверкой прав, как и сам файл.
+    """
+    if file.preview_status != 'READY' or not file.sha256:
+        return {}
+    return {size: reverse('file-preview', kwargs={'pk': file.pk, 'size': size}) for size in PREVIEW_SIZES}
+
+
+def schedule_previews(file_id):
+    from .tasks import generate_file_previews
+
+    try:
+        generate_file_previews.delay(file_id)
+    except Exception as e:
+        logger.warning(f"Preview queue unavailable, file {file_id} left without previews: {str(e)}")
+
+
+def _render_pdf_page(path, directory):
+    """Первая страница PDF в PNG через pdftoppm (poppler-utils)"""
+    prefix = os.path.join(directory, 'page')
+    subprocess.run(
+        ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-png',
+         '-scale-to', str(max(PREVIEW_SIZES.values())), path, prefix],
+        check=True,
+        capture_output=True,
+        timeout=PDFTOPPM_TIMEOUT,
+    )
+    return f"{prefix}.png"
+
+
+def _save_previews(image, sha256):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # От большего к меньшему: каждый следующий размер уменьшается из предыдущего
+    for size, pixels in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((pixels, pixels))
+        name = preview_name(sha256, size)
+        if default_storage.exists(name):
+            continue
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=85, optimize=True)
+        default_storage.save(name, ContentFile(output.getvalue()))
+
+
+def generate_previews(file):
+    """
+    Создает превью всех размеров для изображения или первой страницы PDF.
+    Превью привязаны к содержимому, поэтому для повторно загруженного файла
+    готовые превью переиспользуются, а статус обновляется у всех его копий.
+    """
+    if not file.sha256 or not supports_preview(file.mime_type):
+        File.objects.filter(pk=file.pk).update(preview_status='UNSUPPORTED')
+        return 'UNSUPPORTED'
+
+    names = [preview_name(file.sha256, size) for size in PREVIEW_SIZES]
+    if not all(default_storage.exists(name) for name in names):
+        try:
+            if file.mime_type in PDF_TYPES:
+                with tempfile.TemporaryDirectory() as directory:
+                    with Image.open(_render_pdf_page(file.file.path, directory)) as image:
+                        _save_previews(image, file.sha256)
+            else:
+                with Image.open(file.file.path) as image:
+                    image.draft('RGB', (max(PREVIEW_SIZES.values()),) * 2)
+                    _save_previews(image, file.sha256)
+        except Exception as e:
+            logger.error(f"Error generating previews for file {file.pk}: {str(e)}")
+            File.objects.filter(pk=file.pk).update(preview_status='FAILED')
+            return 'FAILED'
+
+    File.objects.filter(
+        Q(pk=file.pk) | Q(sha256=file.sha256, preview_status__in=['PENDING', 'FAILED'])
+    ).update(preview_status='READY')
+    return 'READY'
+
+
+def delete_previews(sha256):
+    for size in PREVIEW_SIZES:
+        try:
+            default_storage.delete(preview_name(sha256, size))
+        except OSError as e:
+            logger.warning(f"Failed to delete preview {sha256}_{size}: {str(e)}")
@@ -0,0 +1,73 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .models import FolderActionLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Срок хранения журнала в базе, дней (FOLDER_ACTION_LOG_RETENTION_DAYS)
+DEFAULT_RETENTION_DAYS = 180
+
+ARCHIVE_FIELDS = [
+    'id', 'user_id', 'project_id', 'folder_id', 'file_id', 'folder_name', 'file_name',
+    'action_type', 'description', 'created_at',
+]
+
+
+def get_retention_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'FOLDER_ACTION_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def get_archive_dir():
+    return getattr(
+        settings,
+        'FOLDER_ACTION_LOG_ARCHIVE_DIR',
+        os.path.join(str(settings.BASE_DIR), 'archives', 'folder_logs'),
+    )
+
+
+def archive_action_logs(cutoff, archive_dir=None, batch_size=1000):
+    """
+    Переносит записи журнала старше cutoff в помесячные архивы
+    folder_action_log-ГГГГ-ММ.jsonl.gz и удаляет их из базы.
+    Записи обрабатываются пачками по первичному ключу, поэтому память
+    не зависит от объема журнала. Пачка удаляется только после записи
+    в архив: при сбое строки могут повториться в архиве, но не теряются.
+    """
+    archive_dir = archive_dir or get_archive_dir()
+    os.makedirs(archive_dir, exist_ok=True)
+
+    queryset = FolderActionLog.objects.filter(created_at__lt=cutoff).order_by('id')
+    archived = 0
+    last_id = 0
+
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).values(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            break
+
+        rows_by_month = defaultdict(list)
+        for row in rows:
+            rows_by_month[timezone.localtime(row['created_at']).strftime('%Y-%m')].append(row)
+
+        for month, month_rows in rows_by_month.items():
+            path = os.path.join(archive_dir, f"folder_action_log-{month}.jsonl.gz")
+            # Дописываем новый gzip-блок: многоблочный gzip читается как один файл
+            with gzip.open(path, 'at', encoding='utf-8') as archive:
+                for row in month_rows:
+                    archive.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+
+        last_id = rows[-1]['id']
+        FolderActionLog.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        archived += len(rows)
+
+    logger.info(f"Archived {archived} folder action log entries older than {cutoff.isoformat()}")
+    return archived
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from .models import Folder, File
+
+ROLLUP_FIELDS = ['direct_size', 'direct_file_count', 'subtree_size', 'subtree_file_count']
+
+
+def _update_counters(changes):
+    """
+    Применяет изменения счетчиков {id папки: (размер, файлы, размер поддерева, файлы поддерева)}.
+    Папки с одинаковым изменением обновляются одним UPDATE.
+    """
+    groups = defaultdict(list)
+    for folder_id, delta in changes.items():
+        if any(delta):
+            groups[delta].append(folder_id)
+
+    for (direct_size, direct_count, subtree_size, subtree_count), folder_ids in groups.items():
+        Folder.objects.filter(pk__in=sorted(folder_ids)).update(
+            direct_size=F('direct_size') + direct_size,
+            direct_file_count=F('direct_file_count') + direct_count,
+            subtree_size=F('subtree_size') + subtree_size,
+            subtree_file_count=F('subtree_file_count') + subtree_count,
+        )
+
+
+def apply_file_deltas(deltas):
+    """
+    Учитывает добавленные и удаленные файлы: {id папки: (изменение размера, изменение числа файлов)}.
+    Пути папок загружаются одним запросом, предки обновляются по материализованному пути.
+    """
+    deltas = {folder_id: delta for folder_id, delta in deltas.items() if folder_id and any(delta)}
+    if not deltas:
+        return
+
+    paths = dict(Folder.objects.filter(pk__in=list(deltas)).values_list('id', 'path'))
+    changes = defaultdict(lambda: [0, 0, 0, 0])
+    for folder_id, (size, count) in deltas.items():
+        if folder_id not in paths:
+            continue
+        changes[folder_id][0] += size
+        changes[folder_id][1] += count
+        ancestor_ids = [int(item) for item in paths[folder_id].split('/') if item]
+        for target_id in [*ancestor_ids, folder_id]:
+            changes[target_id][2] += size
+            changes[target_id][3] += count
+
+    _update_counters({folder_id: tuple(change) for folder_id, change in changes.items()})
+
+
+def move_subtree(folder_id, old_ancestor_ids, new_ancestor_ids):
+    """Переносит итоги поддерева папки со старых предков на новых"""
+    size, count = Folder.objects.filter(pk=folder_id).values_list('subtree_size', 'subtree_file_count').get()
+    if not size and not count:
+        return
+    old_ids, new_ids = set(old_ancestor_ids), set(new_ancestor_ids)
+    changes = {folder_id: (0, 0, -size, -count) for folder_id in old_ids - new_ids}
+    changes.update({folder_id: (0, 0, size, count) for folder_id in new_ids - old_ids})
+    _update_counters(changes)
+
+
+def recompute_rollups(project_id, batch_size=500):
+    """
+    Пересчитывает итоги папок проекта с нуля: одна агрегация файлов по папкам,
+    суммирование по поддеревьям в памяти и пакетное обновление изменившихся папок.
+    """
+    with transaction.atomic():
+        folders = list(Folder.objects.select_for_update().filter(project_id=project_id).only('id', 'path', *ROLLUP_FIELDS))
+        direct = {
+            row['folder_id']: (row['size'] or 0, row['count'])
+            for row in File.objects.filter(folder__project_id=project_id)
+            .values('folder_id').annotate(size=Sum('size'), count=Count('id')).order_by()
+        }
+
+        totals = defaultdict(lambda: [0, 0])
+        for folder in folders:
+            size, count = direct.get(folder.id, (0, 0))
+            for target_id in [*folder.get_ancestor_ids(), folder.id]:
+                totals[target_id][0] += size
+                totals[target_id][1] += count
+
+        changed = []
+        for folder in folders:
+            values = (*direct.get(folder.id, (0, 0)), *totals[folder.id])
+            if values != tuple(getattr(folder, field) for field in ROLLUP_FIELDS):
+                folder.direct_size, folder.direct_file_count, folder.subtree_size, folder.subtree_file_count = values
+                changed.append(folder)
+
+        Folder.objects.bulk_update(changed, ROLLUP_FIELDS, batch_size=batch_size)
+    return len(changed)
@@ -1,24 +1,36 @@
 from rest_framework import serializers
-from .models import Folder, File, FolderAccess, FolderActionLog
+from .models import Folder, File, FolderAccess, FolderActionLog, UploadSession
 from projects.models import Project
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from .previews import preview_urls
+from .batch import MAX_BATCH_SIZE
+
+User = get_user_model()
 
 class FileSerializer(serializers.ModelSerializer):
     file = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+    previews = serializers.SerializerMethodField()
 
     class Meta:
         model = File
-        fields = ['id', 'name', 'folder', 'file', 'created_at', 'updated_at', 'created_by', 'size', 'mime_type']
-        read_only_fields = ['created_at', 'updated_at', 'created_by', 'size', 'mime_type']
+        fields = ['id', 'name', 'folder', 'file', 'download_url', 'previews', 'preview_status', 'created_at',
+                  'updated_at', 'created_by', 'size', 'mime_type', 'sha256']
+        read_only_fields = ['created_at', 'updated_at', 'created_by', 'size', 'mime_type', 'sha256',
+                            'preview_status']
 
     def get_file(self, obj):
-        if obj.file:
-            try:
-                return f"{settings.MEDIA_HOST}{obj.file.url}"
-            except Exception as e:
-                print(f"Error getting file URL: {e}")
-                return None
-        return None
+        # Прямой адрес в /media/ закрыт: файл доступен только через скачивание
+        return self.get_download_url(obj) if obj.file else None
+
+    def get_download_url(self, obj):
+        # Скачивание через приложение: с проверкой прав и записью в журнал
+        return f"{settings.MEDIA_HOST}{reverse('file-download', kwargs={'pk': obj.id})}"
+
+    def get_previews(self, obj):
+        return {size: f"{settings.MEDIA_HOST}{url}" for size, url in preview_urls(obj).items()}
 
     def create(self, validated_data):
         file = validated_data.get('file')
@@ -29,17 +41,8 @@ class FileSerializer(serializers.ModelSerializer):
             return instance
         return super().create(validated_data)
 
-    def to_representation(self, instance):
-        # Добавляем отладочную информацию
-        print(f"File instance: {instance}")
-        print(f"File URL: {instance.file.url if instance.file else 'No file'}")
-        
-        ret = super().to_representation(instance)
-        print(f"Serialized data: {ret}")
-        return ret
-
 class FolderSerializer(serializers.ModelSerializer):
-    files = FileSerializer(many=True, read_only=True)
+    files = serializers.SerializerMethodField()
     children = serializers.SerializerMethodField()
     project_uuid = serializers.UUIDField(source='project.uuid', read_only=True)
     project = serializers.UUIDField(format='hex_verbose', required=False)
@@ -47,12 +50,22 @@ class FolderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Folder
         fields = ['id', 'name', 'folder_type', 'project', 'project_uuid', 'parent', 'created_at', 
-                 'updated_at', 'created_by', 'files', 'children']
-        read_only_fields = ['created_at', 'updated_at', 'created_by', 'project_uuid']
+                 'updated_at', 'created_by', 'direct_size', 'direct_file_count', 'subtree_size',
+                 'subtree_file_count', 'files', 'children']
+        read_only_fields = ['created_at', 'updated_at', 'created_by', 'project_uuid', 'direct_size',
+                            'direct_file_count', 'subtree_size', 'subtree_file_count']
+
+    def get_files(self, obj):
+        return FileSerializer(obj.files.all(), many=True, context=self.context).data
 
     def get_children(self, obj):
-        children = Folder.objects.filter(parent=obj)
-        return FolderSerializer(children, many=True).data
+        return FolderSerializer(Folder.objects.filter(parent=obj), many=True, context=self.context).data
+
+    def validate_parent(self, value):
+        # Родитель задается только при создании: перемещение идет через move с проверкой циклов и глубины
+        if self.instance is not None and value != self.instance.parent:
+            raise serializers.ValidationError("Для перемещения папки используйте move")
+        return value
 
     def validate_project(self, value):
         if value:
@@ -77,6 +90,12 @@ class FolderAccessSerializer(serializers.ModelSerializer):
         fields = ['id', 'folder', 'user', 'access_level', 'granted_at', 'granted_by']
         read_only_fields = ['granted_at', 'granted_by']
 
+class FolderAccessSubtreeSerializer(serializers.Serializer):
+    """Параметры выдачи или отзыва доступа к поддереву папок"""
+    folder = serializers.PrimaryKeyRelatedField(queryset=Folder.objects.all())
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    access_level = serializers.ChoiceField(choices=Folder.ACCESS_LEVELS, required=False)
+
 class FolderActionLogSerializer(serializers.ModelSerializer):
     user_email = serializers.CharField(source='user.email', read_only=True)
     user_name = serializers.SerializerMethodField()
@@ -116,3 +135,18 @@ class FolderActionLogSerializer(serializers.ModelSerializer):
 
     def get_file_name(self, obj):
         return obj.file.name if obj.file else obj.file_name
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['uuid', 'folder', 'name', 'mime_type', 'size', 'offset', 'status', 'file', 'created_at', 'updated_at']
+        read_only_fields = ['uuid', 'offset', 'status', 'file', 'created_at', 'updated_at']
+
+    def validate_size(self, value):
+        if value < 0:
+            raise serializers.ValidationError("Размер файла не может быть отрицательным")
+        return value
+
+class FileBatchSerializer(serializers.Serializer):
+    files = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=MAX_BATCH_SIZE)
+    folder = serializers.PrimaryKeyRelatedField(queryset=Folder.objects.all(), required=False)
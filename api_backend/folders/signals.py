@@ -1,29 +1,100 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_init
 from django.dispatch import receiver
-from projects.models import Project
-from .models import Folder
+from projects.models import Project, ProjectMember
+from .models import Folder, FolderAccess
+from .visibility import (
+    grant_project_visibility, revoke_project_visibility, grant_folder_visibility, revoke_folder_visibility,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+@receiver(post_init, sender=Project)
+def remember_project_state(sender, instance, **kwargs):
+    """Запоминает загруженные статус и ГИПа, чтобы реагировать только на их изменение"""
+    instance._loaded_status = instance.__dict__.get('status')
+    instance._loaded_gip_id = instance.__dict__.get('gip_id')
+
 @receiver(post_save, sender=Project)
 def create_project_folders(sender, instance, created, **kwargs):
     """
     Создает структуру папок для проекта, когда его статус меняется на 'в работе'
     """
+    status_changed = created or instance.status != instance._loaded_status
+    instance._loaded_status = instance.status
+    if not status_changed or instance.status != 'in_progress':
+        return
+
     try:
-        logger.info(f"Signal triggered for project {instance.id} with status {instance.status}")
-        
-        if instance.status == 'in_progress':
-            logger.info("Status is in_progress, checking existing folders")
-            # Проверяем, есть ли уже созданные корневые папки
-            existing_folders = Folder.objects.filter(project=instance, parent=None).exists()
-            logger.info(f"Existing folders check: {existing_folders}")
-            
-            if not existing_folders:
-                logger.info("Creating default folder structure")
-                Folder.create_default_structure(instance)
-                logger.info("Folder structure created successfully")
+        logger.info(f"Project {instance.id} moved to in_progress, checking existing folders")
+        # Проверяем, есть ли уже созданные корневые папки (проект мог вернуться в работу)
+        if not Folder.objects.filter(project=instance, parent=None).exists():
+            Folder.create_default_structure(instance)
+            logger.info(f"Folder structure created for project {instance.id}")
     except Exception as e:
         logger.error(f"Error creating folder structure: {str(e)}")
         # Возможно, отправить уведомление администратору
+
+# Поддержка индекса видимости FolderVisibility
+
+@receiver(post_save, sender=Project)
+def sync_gip_visibility(sender, instance, created, **kwargs):
+    """Открывает проект текущему ГИПу и закрывает предыдущему"""
+    if not created and instance.gip_id == instance._loaded_gip_id:
+        return
+    gip_user_id = instance.gip.user_id
+    revoke_project_visibility(instance.id, 'GIP', exclude_user_id=gip_user_id)
+    grant_project_visibility(gip_user_id, instance.id, 'GIP')
+    instance._loaded_gip_id = instance.gip_id
+
+@receiver(post_init, sender=ProjectMember)
+def remember_member_state(sender, instance, **kwargs):
+    """Запоминает загруженных участника и проект, чтобы перенести видимость при их изменении"""
+    instance._loaded_member_id = instance.__dict__.get('member_id')
+    instance._loaded_project_id = instance.__dict__.get('project_id')
+
+@receiver(post_save, sender=ProjectMember)
+def grant_member_visibility(sender, instance, created, **kwargs):
+    changed = (instance.member_id, instance.project_id) != (instance._loaded_member_id, instance._loaded_project_id)
+    if not created and not changed:
+        return
+    if not created and instance._loaded_member_id is not None:
+        old_user_id = sender.member.field.related_model.objects.filter(
+            pk=instance._loaded_member_id
+        ).values_list('user_id', flat=True).first()
+        if old_user_id is not None:
+            revoke_project_visibility(instance._loaded_project_id, 'MEMBER', user_id=old_user_id)
+    grant_project_visibility(instance.member.user_id, instance.project_id, 'MEMBER')
+    instance._loaded_member_id = instance.member_id
+    instance._loaded_project_id = instance.project_id
+
+@receiver(post_delete, sender=ProjectMember)
+def revoke_member_visibility(sender, instance, **kwargs):
+    revoke_project_visibility(instance.project_id, 'MEMBER', user_id=instance.member.user_id)
+
+@receiver(post_init, sender=FolderAccess)
+def remember_access_state(sender, instance, **kwargs):
+    """Запоминает загруженных пользователя и папку, чтобы перенести видимость при их изменении"""
+    instance._loaded_user_id = instance.__dict__.get('user_id')
+    instance._loaded_folder_id = instance.__dict__.get('folder_id')
+
+@receiver(post_save, sender=FolderAccess)
+def grant_access_visibility(sender, instance, created, **kwargs):
+    changed = (instance.user_id, instance.folder_id) != (instance._loaded_user_id, instance._loaded_folder_id)
+    if not created and not changed:
+        return
+    if not created and instance._loaded_folder_id is not None:
+        revoke_folder_visibility(instance._loaded_user_id, [instance._loaded_folder_id], 'ACCESS')
+    grant_folder_visibility([(instance.user_id, instance.folder.project_id, instance.folder_id)], 'ACCESS')
+    instance._loaded_user_id = instance.user_id
+    instance._loaded_folder_id = instance.folder_id
+
+@receiver(post_delete, sender=FolderAccess)
+def revoke_access_visibility(sender, instance, **kwargs):
+    # Каскады и удаление по одной записи; массовый отзыв (folders.acl.revoke_access) чистит индекс сам
+    revoke_folder_visibility(instance.user_id, [instance.folder_id], 'ACCESS')
+
+@receiver(post_save, sender=Folder)
+def grant_owner_visibility(sender, instance, created, **kwargs):
+    if created and instance.created_by_id:
+        grant_folder_visibility([(instance.created_by_id, instance.project_id, instance.id)], 'OWNER')
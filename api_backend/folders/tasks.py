@@ -0,0 +1,90 @@
+from celery import shared_task
+
+
+@shared_task
+def write_folder_action_logs(events):
+    """
+    Задача для записи пачки событий журнала действий с папками и файлами.
+
+    Args:
+        events: список событий, подготовленных folders.audit.make_event
+    """
+    from folders.audit import write_action_logs
+
+    logs = write_action_logs(events)
+    return f"{len(logs)} записей добавлено в журнал действий."
+
+
+@shared_task
+def archive_folder_action_logs(days=None):
+    """
+    Задача для переноса старых записей журнала действий в сжатые архивы.
+
+    Args:
+        days: срок хранения в днях. Если None, используется FOLDER_ACTION_LOG_RETENTION_DAYS.
+    """
+    from folders.retention import archive_action_logs, get_retention_cutoff
+
+    archived = archive_action_logs(get_retention_cutoff(days))
+    return f"{archived} записей журнала перенесено в архив."
+
+
+@shared_task
+def collect_unreferenced_blobs():
+    """
+    Задача для удаления содержимого файлов, на которое не ссылается ни один файл.
+    """
+    from folders.blobs import collect_unreferenced_blobs as collect
+
+    removed = collect()
+    return f"{removed} неиспользуемых блобов удалено."
+
+
+@shared_task
+def generate_file_previews(file_id):
+    """
+    Задача для создания превью загруженного изображения или PDF.
+
+    Args:
+        file_id: id записи File
+    """
+    from folders.models import File
+    from folders.previews import generate_previews
+
+    file = File.objects.filter(pk=file_id).first()
+    if file is None:
+        return f"Файл {file_id} не найден."
+    return f"Превью файла {file_id}: {generate_previews(file)}."
+
+
+@shared_task
+def scan_orphaned_media(quarantine_dir=None, dry_run=False):
+    """
+    Задача для удаления (или переноса в карантин) файлов хранилища без ссылок в базе.
+
+    Args:
+        quarantine_dir: каталог карантина; если None, файлы удаляются
+        dry_run: только подсчитать
+    """
+    from folders.media_gc import iter_missing_files, scan_orphaned_media as scan
+
+    stats = scan(quarantine_dir=quarantine_dir, dry_run=dry_run)
+    missing = sum(1 for _ in iter_missing_files())
+    return (
+        f"Проверено файлов: {stats['scanned']}, без ссылок: {stats['orphaned']}, "
+        f"записей без файлов: {missing}."
+    )
+
+
+@shared_task
+def expire_upload_sessions(hours=None):
+    """
+    Задача для удаления брошенных загрузок по частям и их временных файлов.
+
+    Args:
+        hours: срок без новых частей в часах. Если None, используется FILE_UPLOAD_SESSION_MAX_AGE_HOURS.
+    """
+    from folders.uploads import expire_upload_sessions as expire, get_session_cutoff
+
+    sessions, files = expire(get_session_cutoff(hours))
+    return f"Удалено загрузок: {sessions}, временных файлов: {files}."
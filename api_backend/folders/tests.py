@@ -1,6 +1,31 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
 from rest_framework.test import APITestCase
-from .models import Folder, File, FolderAccess
+from accounts.models import LegalProfile, PhysicalProfile
+from projects.models import Project, ProjectComplexity
+from .acl import FolderAccessResolver, revoke_subtree_access
+from .models import Folder, File, FolderAccess, UploadSession
+
+User = get_user_model()
+
+# Те же справочники и учетные записи, что загружает base_load.sh
+BASE_FIXTURES = [
+    'json/base_backup/education.json',
+    'json/base_backup/specialty.json',
+    'json/base_backup/program.json',
+    'json/base_backup/experience.json',
+    'json/base_backup/legal_entity_type.json',
+    'json/base_backup/category.json',
+    'json/base_backup/project_complexity.json',
+    'json/accounts_backup/user.json',
+    'json/accounts_backup/legal_profile.json',
+    'json/accounts_backup/physical_profile.json',
+]
 
 class FolderTests(APITestCase):
     def setUp(self):
@@ -14,3 +39,96 @@ class FolderTests(APITestCase):
     def test_folder_access(self):
         # Тест прав доступа
         pass
+
+class ProjectFolderTestCase(APITestCase):
+    """Проект с рабочей папкой, в которую у ГИПа есть право записи"""
+    fixtures = BASE_FIXTURES
+
+    def setUp(self):
+        gip = PhysicalProfile.objects.first()
+        office = LegalProfile.objects.first()
+        self.user = gip.user
+        project = Project.objects.create(
+            name='Тестовый проект',
+            subtitle='',
+            description='',
+            complexity=ProjectComplexity.objects.first(),
+            estimated_duration=1,
+            client=office,
+            project_office=office,
+            gip=gip,
+        )
+        self.folder = Folder.objects.create(name='Рабочие данные', folder_type='WORKING', project=project)
+        FolderAccess.objects.create(folder=self.folder, user=self.user, access_level='WRITE')
+        self.client.force_authenticate(self.user)
+
+class FolderAccessResolverTests(ProjectFolderTestCase):
+    def test_invalidate_reloads_levels_after_revoke(self):
+        resolver = FolderAccessResolver(self.user)
+        self.assertTrue(resolver.can_write(self.folder))
+
+        revoke_subtree_access(self.folder, self.user.id)
+        # Уровни кэшируются на запрос, пока их не сбросят
+        self.assertTrue(resolver.can_write(self.folder))
+        resolver.invalidate(self.folder.project_id)
+        self.assertFalse(resolver.can_write(self.folder))
+
+class UploadSessionTests(ProjectFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            FILE_UPLOAD_SESSION_DIR=f"{self.media_root}/upload_sessions",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, content):
+        response = self.client.post(reverse('file-upload-list'), {
+            'folder': self.folder.id,
+            'name': name,
+            'size': len(content),
+            'mime_type': 'text/plain',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        session_uuid = response.data['uuid']
+
+        half = len(content) // 2
+        for offset, chunk in ((0, content[:half]), (half, content[half:])):
+            response = self.client.put(
+                f"{reverse('file-upload-chunk', kwargs={'uuid': session_uuid})}?offset={offset}",
+                data=chunk,
+                content_type='application/octet-stream',
+            )
+            self.assertEqual(response.status_code, 200, response.data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('file-upload-complete', kwargs={'uuid': session_uuid}))
+        self.assertEqual(response.status_code, 201, response.data)
+        return File.objects.get(pk=response.data['id']), session_uuid
+
+    def test_complete_moves_new_content_into_blob_storage(self):
+        content = b'new content ' * 1000
+        instance, session_uuid = self.upload('report.txt', content)
+
+        self.assertEqual(instance.size, len(content))
+        self.assertEqual(instance.sha256, hashlib.sha256(content).hexdigest())
+        with instance.file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+
+        session = UploadSession.objects.get(uuid=session_uuid)
+        self.assertEqual(session.status, 'COMPLETED')
+        self.assertFalse(os.path.exists(session.temp_path))
+
+        self.folder.refresh_from_db()
+        self.assertEqual((self.folder.direct_size, self.folder.direct_file_count), (len(content), 1))
+
+    def test_complete_reuses_existing_blob(self):
+        content = b'same content ' * 100
+        first, _ = self.upload('first.txt', content)
+        second, _ = self.upload('second.txt', content)
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(second.file.name, first.file.name)
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .blobs import acquire_blob, attach_blob
+from .models import File, UploadSession
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Размер блока, которым тело запроса читается и пишется на диск
+BLOCK_SIZE = 1024 * 1024
+
+# Рекомендуемый размер части для клиента
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Загрузка без новых частей дольше этого срока удаляется, часов (FILE_UPLOAD_SESSION_MAX_AGE_HOURS)
+DEFAULT_SESSION_MAX_AGE_HOURS = 24
+
+# Состояние SHA-256 незавершенных загрузок: uuid -> (offset, hasher).
+# Части одной загрузки обычно приходят в один процесс, и хэш считается
+# по мере записи. Если состояние потеряно (другой процесс, перезапуск),
+# хэш пересчитывается по временному файлу при завершении.
+MAX_HASHERS = 256
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+class OffsetMismatch(Exception):
+    """Часть пришла не с того смещения, на котором остановилась загрузка"""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+def _take_hasher(session):
+    with _hashers_lock:
+        state = _hashers.pop(session.uuid, None)
+    if state and state[0] == session.offset:
+        return state[1]
+    if session.offset == 0:
+        return hashlib.sha256()
+    return None
+
+
+def _keep_hasher(session, hasher):
+    with _hashers_lock:
+        _hashers[session.uuid] = (session.offset, hasher)
+        while len(_hashers) > MAX_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def _drop_hasher(session):
+    with _hashers_lock:
+        _hashers.pop(session.uuid, None)
+
+
+def _file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def start_upload(folder, user, name, size, mime_type=''):
+    session = UploadSession.objects.create(
+        folder=folder,
+        created_by=user,
+        name=name,
+        size=size,
+        mime_type=mime_type or '',
+    )
+    os.makedirs(os.path.dirname(session.temp_path), exist_ok=True)
+    open(session.temp_path, 'wb').close()
+    return session
+
+
+def append_chunk(session_id, stream, offset):
+    """
+    Дописывает часть из потока запроса во временный файл блоками по BLOCK_SIZE.
+    Сессия блокируется на время записи, поэтому параллельные части
+    одной загрузки выполняются по очереди.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != 'ACTIVE':
+            raise ValidationError("Загрузка уже завершена")
+        if offset != session.offset:
+            raise OffsetMismatch(session.offset)
+
+        hasher = _take_hasher(session)
+        written = 0
+        with open(session.temp_path, 'r+b') as f:
+            # Хвост от прерванной записи, не подтвержденной в базе, отбрасываем
+            f.truncate(session.offset)
+            f.seek(session.offset)
+            try:
+                while True:
+                    block = stream.read(BLOCK_SIZE) if stream is not None else b''
+                    if not block:
+                        break
+                    if session.offset + written + len(block) > session.size:
+                        raise ValidationError("Размер части превышает заявленный размер файла")
+                    f.write(block)
+                    if hasher:
+                        hasher.update(block)
+                    written += len(block)
+            except Exception:
+                f.truncate(session.offset)
+                raise
+
+        session.offset += written
+        session.save(update_fields=['offset', 'updated_at'])
+
+    if hasher:
+        _keep_hasher(session, hasher)
+    return session
+
+
+def complete_upload(session_id):
+    """
+    Создает запись File в той же транзакции, что и закрытие сессии. Собранный
+    файл переносится в хранилище блобов (переименованием, без копирования)
+    после фиксации, поэтому при откате загрузку можно завершить повторно.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().select_related('folder').get(pk=session_id)
+        if session.status != 'ACTIVE':
+            raise ValidationError("Загрузка уже завершена")
+        if session.offset != session.size:
+            raise ValidationError(f"Загружено {session.offset} из {session.size} байт")
+
+        hasher = _take_hasher(session)
+        sha256 = hasher.hexdigest() if hasher else _file_sha256(session.temp_path)
+
+        # Одинаковое содержимое хранится один раз: для известного хэша
+        # временный файл после фиксации удаляется и создается только запись File
+        blob = acquire_blob(sha256, session.size, path=session.temp_path)
+        instance = File(
+            name=session.name,
+            folder=session.folder,
+            created_by=session.created_by,
+            mime_type=session.mime_type,
+        )
+        attach_blob(instance, blob)
+        instance.save()
+
+        session.status = 'COMPLETED'
+        session.file = instance
+        session.save(update_fields=['status', 'file', 'updated_at'])
+
+    return instance
+
+
+def cancel_upload(session):
+    _drop_hasher(session)
+    if os.path.isfile(session.temp_path):
+        os.remove(session.temp_path)
+    session.delete()
+
+
+def get_session_cutoff(hours=None):
+    if hours is None:
+        hours = getattr(settings, 'FILE_UPLOAD_SESSION_MAX_AGE_HOURS', DEFAULT_SESSION_MAX_AGE_HOURS)
+    return timezone.now() - timedelta(hours=hours)
+
+
+def _remove_temp_files(paths):
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove upload temp file {path}: {str(e)}")
+    return removed
+
+
+def expire_upload_sessions(cutoff, batch_size=500):
+    """
+    Удаляет сессии, не менявшиеся с cutoff, и их временные файлы, а также
+    временные файлы старше cutoff, для которых сессии уже нет (удалены
+    каскадом вместе с папкой). Сессии, в которые сейчас пишется часть,
+    заблокированы и пропускаются. Возвращает (число сессий, число файлов).
+    """
+    sessions = removed_files = 0
+    while True:
+        with transaction.atomic():
+            stale = list(
+                UploadSession.objects.select_for_update(skip_locked=True)
+                .filter(updated_at__lt=cutoff)
+                .order_by('pk')[:batch_size]
+            )
+            if not stale:
+                break
+            UploadSession.objects.filter(pk__in=[session.pk for session in stale]).delete()
+        for session in stale:
+            _drop_hasher(session)
+        removed_files += _remove_temp_files([session.temp_path for session in stale])
+        sessions += len(stale)
+
+    temp_dir = UploadSession.get_temp_dir()
+    if not os.path.isdir(temp_dir):
+        return sessions, removed_files
+    candidates = {}
+    with os.scandir(temp_dir) as entries:
+        for entry in entries:
+            session_uuid, ext = os.path.splitext(entry.name)
+            if ext == '.part' and entry.is_file() and entry.stat().st_mtime < cutoff.timestamp():
+                candidates[session_uuid] = entry.path
+    uuids = list(candidates)
+    for start in range(0, len(uuids), batch_size):
+        chunk = uuids[start:start + batch_size]
+        known = {
+            str(session_uuid)
+            for session_uuid in UploadSession.objects.filter(uuid__in=chunk).values_list('uuid', flat=True)
+        }
+        removed_files += _remove_temp_files([candidates[key] for key in chunk if key not in known])
+    return sessions, removed_files
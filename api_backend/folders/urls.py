@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FolderViewSet, FileViewSet, FolderAccessViewSet, FolderActionLogViewSet
+from .views import FolderViewSet, FileViewSet, FolderAccessViewSet, FolderActionLogViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'files', FileViewSet, basename='file')
 router.register(r'access', FolderAccessViewSet, basename='folder-access')
 router.register(r'logs', FolderActionLogViewSet, basename='folder-logs')
+router.register(r'uploads', UploadSessionViewSet, basename='file-upload')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -17,6 +18,11 @@ urlpatterns = [
          }), 
          name='project-folders'),
          
+    # Поиск папки по пути от корневой папки
+    path('projects/<uuid:project_uuid>/folders/resolve/', 
+         FolderViewSet.as_view({'get': 'resolve_path'}), 
+         name='project-folder-resolve'),
+
     path('projects/<uuid:project_uuid>/folders/<int:pk>/', 
          FolderViewSet.as_view({
              'get': 'retrieve',
@@ -31,6 +37,11 @@ urlpatterns = [
          FolderViewSet.as_view({'post': 'create_subfolder'}), 
          name='create-subfolder'),
          
+    # Скачивание папки с подпапками одним архивом
+    path('projects/<uuid:project_uuid>/folders/<int:pk>/zip/', 
+         FolderViewSet.as_view({'get': 'download_zip'}), 
+         name='project-folder-zip'),
+         
     # Маршруты для файлов
     path('projects/<uuid:project_uuid>/folders/<int:folder_id>/files/', 
          FileViewSet.as_view({
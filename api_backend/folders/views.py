@@ -4,16 +4,41 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from .models import Folder, File, FolderAccess, FolderActionLog
-from projects.models import Project, ProjectMember
-from .serializers import FolderSerializer, FileSerializer, FolderAccessSerializer, FolderActionLogSerializer
-from django.db.models import Q
-from rest_framework.exceptions import ValidationError, PermissionDenied
+from .models import Folder, File, FolderAccess, FolderActionLog, UploadSession
+from projects.models import Project
+from .serializers import (
+    FolderSerializer, FileSerializer, FolderAccessSerializer, FolderActionLogSerializer,
+    FolderAccessSubtreeSerializer, UploadSessionSerializer, FileBatchSerializer,
+)
+from .listing import (
+    FileRowRenderer, FolderRowRenderer, FolderTreeRenderer, FILE_COLUMNS, FILE_FIELDS, FOLDER_COLUMNS,
+    FOLDER_FIELDS, NESTED_FIELDS, parse_fields, split_folder_path, resolve_folder_path,
+)
+from .archive import collect_entries, astream_zip
+from .media_gc import remove_physical_files
+from .previews import PREVIEW_SIZES, preview_name
+from .batch import find_name_conflicts, move_files, delete_files, copy_files
+from .blobs import content_sha256, acquire_blob, attach_blob
+from .uploads import CHUNK_SIZE, OffsetMismatch, start_upload, append_chunk, complete_upload, cancel_upload
+from .audit import make_event, log_events
+from .visibility import visible_to, PROJECT_SOURCES
+from .acl import (
+    FolderAccessResolver, inherit_access,
+    grant_subtree_access, revoke_subtree_access,
+)
+from django.db import transaction
+from django.db.models import Q, Max
+from rest_framework.exceptions import ValidationError, PermissionDenied, NotFound
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from urllib.parse import quote
 import logging
-import os
 from functools import wraps
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.pagination import CursorPagination
+from rest_framework.filters import OrderingFilter
 from django.conf import settings
+from django.core.files.storage import default_storage
 
 logger = logging.getLogger(__name__)
 
@@ -21,104 +46,49 @@ def log_folder_action(action_type):
     def decorator(func):
         @wraps(func)
         def wrapper(view_instance, request, *args, **kwargs):
-            # Для DELETE получаем и сохраняем информацию об объекте до удаления
+            is_folder_view = isinstance(view_instance, FolderViewSet)
+
+            # Для DELETE запоминаем объект до удаления (get_object кэшируется во вьюсете)
             pre_instance = None
-            pre_instance_name = None
-            pre_instance_type = None
-            
             if action_type == 'DELETE':
                 try:
                     pre_instance = view_instance.get_object()
-                    pre_instance_name = pre_instance.name
-                    pre_instance_type = 'папку' if isinstance(pre_instance, Folder) else 'файл'
-                except:
+                except Exception:
                     pass
 
             # Выполняем действие
             response = func(view_instance, request, *args, **kwargs)
-            
-            try:
-                user = request.user
-                project_uuid = kwargs.get('project_uuid')
-                project = Project.objects.get(uuid=project_uuid) if project_uuid else None
 
-                # Определяем объект в зависимости от типа действия
-                instance = None
-                instance_name = None
-                
+            if response.status_code >= 400:
+                return response
+
+            try:
+                # Событие собирается из уже известных данных без дополнительных запросов,
+                # запись в журнал выполняется пачкой после фиксации транзакции
                 if action_type == 'DELETE':
-                    instance = None  # Объект уже удален
-                    instance_name = pre_instance_name
-                    object_type = pre_instance_type
-                else:
-                    if action_type == 'CREATE':
-                        if hasattr(response, 'data') and response.data.get('id'):
-                            instance = Folder.objects.filter(id=response.data['id']).first()
-                    elif action_type == 'UPLOAD':
-                        if hasattr(response, 'data') and response.data.get('id'):
-                            instance = File.objects.filter(id=response.data['id']).first()
-                    elif hasattr(response, 'data') and response.data.get('id'):
-                        model = Folder if view_instance.__class__.__name__ == 'FolderViewSet' else File
-                        instance = model.objects.filter(id=response.data['id']).first()
-                    
-                    if instance:
-                        instance_name = instance.name
-                        object_type = 'папку' if isinstance(instance, Folder) else 'файл'
-
-                # Получаем имя пользователя
-                if user.profile_type == 'physical':
-                    try:
-                        profile = user.physical_profile
-                        user_name = f"{profile.last_name} {profile.first_name}"
-                        if profile.middle_name:
-                            user_name += f" {profile.middle_name}"
-                        user_name = user_name.strip()
-                    except:
-                        user_name = user.email
-                elif user.profile_type == 'legal':
-                    try:
-                        user_name = user.legal_profile.company_name
-                    except:
-                        user_name = user.email
-                else:
-                    user_name = user.email
-
-                # Формируем описание действия
-                action_types = {
-                    'CREATE': 'создал(а)',
-                    'UPDATE': 'изменил(а) название',
-                    'DELETE': 'удалил(а)',
-                    'MOVE': 'переместил(а)',
-                    'UPLOAD': 'загрузил(а)',
-                    'DOWNLOAD': 'скачал(а)'
-                }
-                
-                action_text = action_types.get(action_type, action_type)
-                
-                if instance_name:
-                    # Для подпапок добавляем информацию о родительской папке
-                    if action_type == 'CREATE' and isinstance(instance, Folder) and instance.parent:
-                        description = f"{user_name} {action_text} папку '{instance_name}' в папке '{instance.parent.name}'"
-                    # Для файлов добавляем информацию о папке
-                    elif isinstance(instance, File):
-                        description = f"{user_name} {action_text} файл '{instance_name}' в папке '{instance.folder.name}'"
+                    object_id = pre_instance.id if pre_instance else None
+                    name = pre_instance.name if pre_instance else None
+                    if pre_instance is None:
+                        parent_id = None
+                    elif is_folder_view:
+                        parent_id = pre_instance.parent_id
                     else:
-                        description = f"{user_name} {action_text} {object_type} '{instance_name}'"
+                        parent_id = pre_instance.folder_id
                 else:
-                    description = f"{user_name} выполнил(а) действие {action_text}"
-
-                # Создаем запись в логе
-                log_entry = FolderActionLog.objects.create(
-                    user=user,
-                    project=project,
-                    folder=instance if isinstance(instance, Folder) else None,
-                    file=instance if isinstance(instance, File) else None,
-                    folder_name=instance_name if pre_instance_type == 'папку' else None,
-                    file_name=instance_name if pre_instance_type == 'файл' else None,
-                    action_type=action_type,
-                    description=description
-                )
-                logger.info(f"Created log entry: {log_entry}")
+                    data = getattr(response, 'data', None) or {}
+                    object_id = data.get('id')
+                    name = data.get('name')
+                    parent_id = data.get('parent') if is_folder_view else data.get('folder')
+
+                log_events([make_event(
+                    request.user,
+                    action_type,
+                    'folder' if is_folder_view else 'file',
+                    object_id=object_id,
+                    name=name,
+                    parent_id=parent_id,
+                    project_uuid=kwargs.get('project_uuid'),
+                )])
 
             except Exception as e:
                 logger.error(f"Ошибка при логировании действия: {str(e)}")
@@ -130,15 +100,26 @@ def log_folder_action(action_type):
 
 # Create your views here.
 
-class FolderViewSet(viewsets.ModelViewSet):
+class FolderAccessMixin:
+    """Проверки прав через общий для запроса резолвер уровней доступа"""
+
+    @property
+    def folder_access(self):
+        return FolderAccessResolver.for_request(self.request)
+
+    def get_object(self):
+        # Объект загружается один раз за запрос (его использует и журнал действий)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+class FolderViewSet(FolderAccessMixin, viewsets.ModelViewSet):
     serializer_class = FolderSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         """Получение списка папок с учетом прав доступа"""
         user = self.request.user
-        logger.info(f"Getting folders for user: {user.email}")
-        
         queryset = Folder.objects.all()
 
         # Фильтрация по проекту
@@ -146,41 +127,14 @@ class FolderViewSet(viewsets.ModelViewSet):
         if project_uuid:
             try:
                 project = Project.objects.get(uuid=project_uuid)
-                logger.info(f"Found project: {project.name} (UUID: {project.uuid})")
-                
-                # Проверяем членство в команде через ProjectMember
-                is_team_member = ProjectMember.objects.filter(
-                    project=project,
-                    member__user=user
-                ).exists()
-                logger.info(f"User is team member: {is_team_member}")
-                
-                # Проверяем, является ли пользователь ГИПом проекта
-                is_gip = project.gip.user == user
-                logger.info(f"User is GIP: {is_gip}")
-                
                 queryset = queryset.filter(project=project)
             except Project.DoesNotExist:
                 logger.error(f"Project with UUID {project_uuid} not found")
                 raise ValidationError(f"Project with UUID {project_uuid} not found")
 
-        # Проверяем прямые права доступа
-        direct_access = FolderAccess.objects.filter(user=user).exists()
-        logger.info(f"User has direct folder access: {direct_access}")
-
-        # Проверяем созданные пользователем папки
-        created_folders = Folder.objects.filter(created_by=user).exists()
-        logger.info(f"User has created folders: {created_folders}")
-
-        # Фильтрация по правам доступа
-        queryset = queryset.filter(
-            Q(access_rights__user=user) |
-            Q(project__members__member__user=user) |  # Проверка через ProjectMember
-            Q(project__gip__user=user) |             # Проверка ГИПа
-            Q(created_by=user)
-        ).distinct()
-
-        return queryset
+        # Фильтрация по правам доступа через индекс видимости
+        # (доступ к папке, участник проекта, ГИП, автор папки)
+        return queryset.filter(visible_to(user))
 
     def perform_create(self, serializer):
         """Создание новой папки"""
@@ -216,11 +170,13 @@ class FolderViewSet(viewsets.ModelViewSet):
             folder_name = request.query_params.get('name')
             if folder_name:
                 queryset = queryset.filter(name=folder_name)
-                if not queryset.exists():
-                    raise ValidationError(f"Folder with name '{folder_name}' not found in project")
-            
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
+
+            folder_ids = list(queryset.values_list('id', flat=True))
+            if folder_name and not folder_ids:
+                raise ValidationError(f"Folder with name '{folder_name}' not found in project")
+
+            tree = self.get_tree_renderer(project)
+            return Response(tree.render_ids(folder_ids))
             
         except Project.DoesNotExist:
             raise ValidationError(f"Project with UUID {project_uuid} not found")
@@ -243,9 +199,9 @@ class FolderViewSet(viewsets.ModelViewSet):
             
             if not folder:
                 raise ValidationError(f"Folder with name '{name}' not found in project")
-                
-            serializer = self.get_serializer(folder)
-            return Response(serializer.data)
+
+            tree = self.get_tree_renderer(project)
+            return Response(tree.render(tree.folders[folder.id]))
             
         except Project.DoesNotExist:
             raise ValidationError(f"Project with UUID {project_uuid} not found")
@@ -265,21 +221,12 @@ class FolderViewSet(viewsets.ModelViewSet):
                 raise ValidationError("Название папки не может быть длиннее 50 символов")
 
             # Проверяем права доступа
-            if not FolderAccess.objects.filter(
-                folder=parent_folder,
-                user=request.user,
-                access_level__in=['WRITE', 'ADMIN']
-            ).exists():
+            if not self.folder_access.can_write(parent_folder):
                 raise PermissionDenied("У вас нет прав на создание подпапок")
 
             # Проверка максимальной глубины вложенности
-            nesting_level = 1
-            current = parent_folder
-            while current.parent:
-                nesting_level += 1
-                current = current.parent
-                if nesting_level > 5:
-                    raise ValidationError("Превышена максимальная глубина вложенности папок (5)")
+            if parent_folder.depth + 1 > Folder.MAX_DEPTH:
+                raise ValidationError(f"Превышена максимальная глубина вложенности папок ({Folder.MAX_DEPTH})")
 
             # Проверка уникальности имени
             if Folder.objects.filter(
@@ -297,14 +244,8 @@ class FolderViewSet(viewsets.ModelViewSet):
             )
             
             # Наследуем права доступа от родительской папки
-            parent_accesses = FolderAccess.objects.filter(folder=parent_folder)
-            for access in parent_accesses:
-                FolderAccess.objects.create(
-                    folder=new_folder,
-                    user=access.user,
-                    access_level=access.access_level,
-                    granted_by=request.user
-                )
+            inherit_access(parent_folder, new_folder, granted_by=request.user)
+            self.folder_access.invalidate(new_folder.project_id)
             
             serializer = self.get_serializer(new_folder)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -330,13 +271,8 @@ class FolderViewSet(viewsets.ModelViewSet):
             parent_id = request.data.get('parent')
             if parent_id:
                 parent = Folder.objects.get(id=parent_id)
-                nesting_level = 1
-                current = parent
-                while current.parent:
-                    nesting_level += 1
-                    current = current.parent
-                    if nesting_level > 5:  # Максимальная глубина вложенности
-                        raise ValidationError("Превышена максимальная глубина вложенности папок (5)")
+                if parent.depth + 1 > Folder.MAX_DEPTH:
+                    raise ValidationError(f"Превышена максимальная глубина вложенности папок ({Folder.MAX_DEPTH})")
 
             # Проверка уникальности имени папки в пределах родительской папки и проекта
             name = request.data.get('name')
@@ -368,11 +304,7 @@ class FolderViewSet(viewsets.ModelViewSet):
                 raise ValidationError("Название папки не может быть длиннее 50 символов")
 
             # Проверка прав доступа
-            if not FolderAccess.objects.filter(
-                folder=instance,
-                user=request.user,
-                access_level='ADMIN'
-            ).exists():
+            if not self.folder_access.is_admin(instance):
                 raise PermissionDenied("У вас нет прав на изменение этой папки")
 
             # Проверка уникальности нового имени
@@ -400,11 +332,7 @@ class FolderViewSet(viewsets.ModelViewSet):
             instance = self.get_object()
             
             # Проверка прав доступа
-            if not FolderAccess.objects.filter(
-                folder=instance,
-                user=request.user,
-                access_level='ADMIN'
-            ).exists():
+            if not self.folder_access.is_admin(instance):
                 raise PermissionDenied("У вас нет прав на удаление этой папки")
 
             # Проверка наличия подпапок и файлов
@@ -434,26 +362,25 @@ class FolderViewSet(viewsets.ModelViewSet):
             new_parent_id = request.data.get('new_parent')
             
             # Проверка прав доступа
-            if not FolderAccess.objects.filter(
-                folder=folder,
-                user=request.user,
-                access_level='ADMIN'
-            ).exists():
+            if not self.folder_access.is_admin(folder):
                 raise PermissionDenied("У вас нет прав на перемещение этой папки")
 
             if new_parent_id:
                 new_parent = get_object_or_404(Folder, id=new_parent_id)
                 
                 # Проверка, что новая родительская папка находится в том же проекте
-                if new_parent.project != folder.project:
+                if new_parent.project_id != folder.project_id:
                     raise ValidationError("Нельзя переместить папку в другой проект")
                 
-                # Проверка циклических ссылок
-                current = new_parent
-                while current:
-                    if current == folder:
-                        raise ValidationError("Нельзя переместить папку внутрь её подпапки")
-                    current = current.parent
+                # Проверка циклических ссылок по материализованному пути
+                if new_parent == folder or new_parent.is_descendant_of(folder):
+                    raise ValidationError("Нельзя переместить папку внутрь её подпапки")
+
+                # Проверка глубины самого глубокого потомка после перемещения
+                subtree_depth = folder.get_descendants().aggregate(max_depth=Max('depth'))['max_depth']
+                subtree_height = (subtree_depth or folder.depth) - folder.depth
+                if new_parent.depth + 1 + subtree_height > Folder.MAX_DEPTH:
+                    raise ValidationError(f"Превышена максимальная глубина вложенности папок ({Folder.MAX_DEPTH})")
 
                 folder.parent = new_parent
             else:
@@ -507,6 +434,10 @@ class FolderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def get_tree_renderer(self, project):
+        """Дерево проекта для ответов на чтение: строки values() без сериализаторов"""
+        return FolderTreeRenderer(project, parse_fields(self.request, FOLDER_FIELDS))
+
     def get_project_or_404(self, project_uuid):
         """Получение проекта или 404"""
         try:
@@ -514,31 +445,131 @@ class FolderViewSet(viewsets.ModelViewSet):
         except Project.DoesNotExist:
             raise ValidationError(f"Project with UUID {project_uuid} not found")
 
+    def download_zip(self, request, project_uuid=None, pk=None):
+        """Скачивание папки со всеми видимыми подпапками одним ZIP-архивом"""
+        project = self.get_project_or_404(project_uuid)
+        folder = self.get_object()
+
+        if folder.project_id != project.id:
+            raise ValidationError("Folder does not belong to specified project")
+
+        entries = collect_entries(folder, request.user)
+
+        log_events([make_event(
+            request.user,
+            'DOWNLOAD',
+            'folder',
+            object_id=folder.id,
+            name=folder.name,
+            parent_id=folder.parent_id,
+            project_uuid=project_uuid,
+        )])
+
+        response = StreamingHttpResponse(astream_zip(entries), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, f"{folder.name}.zip")
+        # Архив отдается клиенту по мере сборки, без буферизации в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
     def retrieve(self, request, project_uuid=None, *args, **kwargs):
         """Получение конкретной папки проекта"""
         project = self.get_project_or_404(project_uuid)
         instance = self.get_object()
         
-        if instance.project != project:
+        if instance.project_id != project.id:
             raise ValidationError("Folder does not belong to specified project")
-            
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
 
-class FileViewSet(viewsets.ModelViewSet):
+        tree = self.get_tree_renderer(project)
+        return Response(tree.render(tree.folders[instance.id]))
+
+    def resolve_path(self, request, project_uuid=None):
+        """
+        Папка по пути от корневой папки: ?path=WORKING/АР/Стадия П.
+        ?expand=children,files добавляет непосредственные подпапки и файлы.
+        """
+        project = self.get_project_or_404(project_uuid)
+        segments = split_folder_path(request.query_params.get('path'))
+        expand = {item.strip() for item in request.query_params.get('expand', '').split(',') if item.strip()}
+        if expand - set(NESTED_FIELDS):
+            raise ValidationError({'expand': "Allowed values: children, files"})
+
+        chain = resolve_folder_path(self.get_queryset().filter(project=project), segments)
+        if chain is None:
+            raise NotFound(f"Folder '{'/'.join(segments)}' not found in project")
+
+        folder = chain[-1]
+        renderer = FolderRowRenderer(project, parse_fields(request, FOLDER_FIELDS))
+        data = renderer.render(folder)
+        data['breadcrumbs'] = [{'id': row['id'], 'name': row['name']} for row in chain]
+        if 'children' in expand:
+            children = self.get_queryset().filter(parent_id=folder['id']).values(*FOLDER_COLUMNS)
+            data['children'] = renderer.render_many(children)
+        if 'files' in expand:
+            files = File.objects.filter(folder_id=folder['id']).order_by('name').values(*FILE_COLUMNS)
+            data['files'] = renderer.file_renderer.render_many(files)
+        return Response(data)
+
+class FilePagination(CursorPagination):
+    """Постраничный вывод файлов папки по ключу сортировки без OFFSET"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-updated_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        # name и size не уникальны: без id строки с равными значениями пропадают или повторяются между страницами
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+class FileViewSet(FolderAccessMixin, viewsets.ModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = FilePagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['name', 'size', 'updated_at', 'created_at']
+    ordering = ('-updated_at', '-id')
 
     def get_queryset(self):
         """Получение списка файлов с учетом прав доступа"""
         user = self.request.user
-        return File.objects.filter(
-            Q(folder__access_rights__user=user) |
-            Q(folder__project__members__member__user=user) |  # Проверка через ProjectMember
-            Q(folder__project__gip__user=user) |             # Проверка ГИПа
+        queryset = File.objects.filter(
+            # Автор папки (OWNER) сам по себе не видит чужие файлы в ней
+            Q(visible_to(
+                user,
+                project_ref='folder__project',
+                folder_ref='folder',
+                sources=PROJECT_SOURCES + ['ACCESS'],
+            )) |
             Q(created_by=user)
-        ).distinct()
+        ).select_related('folder')
+
+        # Вложенный маршрут projects/<uuid>/folders/<folder_id>/files/
+        folder_id = self.kwargs.get('folder_id')
+        if folder_id:
+            queryset = queryset.filter(folder_id=folder_id)
+        project_uuid = self.kwargs.get('project_uuid')
+        if project_uuid:
+            queryset = queryset.filter(folder__project__uuid=project_uuid)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Список файлов: только нужные столбцы и словари без сериализатора"""
+        renderer = FileRowRenderer(parse_fields(request, FILE_FIELDS))
+        rows = self.filter_queryset(self.get_queryset()).values(*FILE_COLUMNS)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(renderer.render_many(page))
+        return Response(renderer.render_many(rows))
+
+    def paginate_queryset(self, queryset):
+        # Постранично отдается только список файлов папки, общий список не меняется
+        if 'folder_id' not in self.kwargs:
+            return None
+        return super().paginate_queryset(queryset)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -555,11 +586,7 @@ class FileViewSet(viewsets.ModelViewSet):
             folder = get_object_or_404(Folder, id=folder_id)
             
             # Проверка прав доступа
-            if not FolderAccess.objects.filter(
-                folder=folder,
-                user=request.user,
-                access_level__in=['WRITE', 'ADMIN']
-            ).exists():
+            if not self.folder_access.can_write(folder):
                 raise PermissionDenied("У вас нет прав на загрузку файлов в эту папку")
 
             # Проверка файла
@@ -567,32 +594,17 @@ class FileViewSet(viewsets.ModelViewSet):
             if not file:
                 raise ValidationError("File is required")
 
-            # Отладочная информация
-            print("Received file:", file)
-            print("File name:", file.name)
-            print("File size:", file.size)
-            print("Content type:", file.content_type)
-
-            # Создаем файл
-            instance = File.objects.create(
-                name=request.data.get('name', file.name),
-                folder=folder,
-                file=file,
-                created_by=request.user,
-                size=file.size,
-                mime_type=file.content_type
-            )
-
-            # Проверяем сохранение
-            print("File saved:", instance.file)
-            print("File path:", instance.file.path if instance.file else "No path")
-            print("File URL:", instance.file.url if instance.file else "No URL")
-            print("File exists:", os.path.exists(instance.file.path) if instance.file else False)
-
-            # Проверяем права доступа к папке media
-            media_path = settings.MEDIA_ROOT
-            print(f"Media path permissions: {oct(os.stat(media_path).st_mode)[-3:]}")
-            print(f"Media path owner: {os.stat(media_path).st_uid}")
+            # Создаем файл; одинаковое содержимое хранится один раз
+            with transaction.atomic():
+                blob = acquire_blob(content_sha256(file), file.size, content=file)
+                instance = File(
+                    name=request.data.get('name', file.name),
+                    folder=folder,
+                    created_by=request.user,
+                    mime_type=file.content_type
+                )
+                attach_blob(instance, blob)
+                instance.save()
 
             serializer = self.get_serializer(instance)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -613,19 +625,20 @@ class FileViewSet(viewsets.ModelViewSet):
             instance = self.get_object()
             
             # Проверка прав доступа
-            if not FolderAccess.objects.filter(
-                folder=instance.folder,
-                user=request.user,
-                access_level__in=['WRITE', 'ADMIN']
-            ).exists():
+            if not self.folder_access.can_write(instance.folder):
                 raise PermissionDenied("У вас нет прав на удаление этого файла")
 
-            # Удаление физического файла
-            if instance.file:
-                if os.path.isfile(instance.file.path):
-                    os.remove(instance.file.path)
+            if instance.blob_id:
+                # Общее содержимое не удаляем: его освободит сборщик блобов
+                return super().destroy(request, *args, **kwargs)
 
-            return super().destroy(request, *args, **kwargs)
+            # Физический файл удаляется только после фиксации удаления записи
+            with transaction.atomic():
+                response = super().destroy(request, *args, **kwargs)
+                if instance.file:
+                    path = instance.file.path
+                    transaction.on_commit(lambda: remove_physical_files([path]))
+            return response
 
         except Exception as e:
             logger.error(f"Error deleting file: {str(e)}")
@@ -634,6 +647,59 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Скачивание файла. Права проверяются здесь, а байты отдает nginx
+        через внутренний location (X-Accel-Redirect) с поддержкой Range.
+        """
+        instance = self.get_object()
+        if not instance.file:
+            raise NotFound("Файл не найден в хранилище")
+
+        log_events([make_event(
+            request.user,
+            'DOWNLOAD',
+            'file',
+            object_id=instance.id,
+            name=instance.name,
+            parent_id=instance.folder_id,
+        )])
+
+        content_type = instance.mime_type or 'application/octet-stream'
+        if not getattr(settings, 'USE_X_ACCEL_REDIRECT', True):
+            return FileResponse(
+                instance.file.open('rb'),
+                as_attachment=True,
+                filename=instance.name,
+                content_type=content_type,
+            )
+
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(True, instance.name)
+        response['X-Accel-Redirect'] = (
+            getattr(settings, 'X_ACCEL_REDIRECT_PREFIX', '/protected-media/') + quote(instance.file.name)
+        )
+        return response
+
+    @action(detail=True, methods=['get'], url_path=f"preview/(?P<size>{'|'.join(PREVIEW_SIZES)})")
+    def preview(self, request, pk=None, size=None):
+        """Превью файла: права проверяются как при скачивании, байты отдает nginx"""
+        instance = self.get_object()
+        if instance.preview_status != 'READY' or not instance.sha256:
+            raise NotFound("Превью не готово")
+
+        name = preview_name(instance.sha256, size)
+        if not getattr(settings, 'USE_X_ACCEL_REDIRECT', True):
+            try:
+                return FileResponse(default_storage.open(name, 'rb'), content_type='image/jpeg')
+            except FileNotFoundError:
+                raise NotFound("Превью не найдено в хранилище")
+
+        response = HttpResponse(content_type='image/jpeg')
+        response['X-Accel-Redirect'] = getattr(settings, 'X_ACCEL_REDIRECT_PREFIX', '/protected-media/') + quote(name)
+        return response
+
     @action(detail=True, methods=['post'])
     def move(self, request, pk=None):
         """
@@ -649,19 +715,12 @@ class FileViewSet(viewsets.ModelViewSet):
             new_folder = get_object_or_404(Folder, id=new_folder_id)
             
             # Проверка прав доступа к текущей и новой папке
-            if not (FolderAccess.objects.filter(
-                folder=file.folder,
-                user=request.user,
-                access_level__in=['WRITE', 'ADMIN']
-            ).exists() and FolderAccess.objects.filter(
-                folder=new_folder,
-                user=request.user,
-                access_level__in=['WRITE', 'ADMIN']
-            ).exists()):
+            if not (self.folder_access.can_write(file.folder) and
+                    self.folder_access.can_write(new_folder)):
                 raise PermissionDenied("У вас нет прав на перемещение файла")
 
             # Проверка, что папки находятся в одном проекте
-            if file.folder.project != new_folder.project:
+            if file.folder.project_id != new_folder.project_id:
                 raise ValidationError("Нельзя переместить файл в папку другого проекта")
 
             # Проверка уникальности имени в новой папке
@@ -680,39 +739,240 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-class FolderAccessViewSet(viewsets.ModelViewSet):
+    def get_batch_files(self, request, require_folder=False):
+        """Файлы пакетной операции одним запросом и целевая папка"""
+        serializer = FileBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data.get('folder')
+        if require_folder and target is None:
+            raise ValidationError({'folder': 'This field is required.'})
+
+        file_ids = set(serializer.validated_data['files'])
+        files = list(self.get_queryset().filter(id__in=file_ids).select_related('folder', 'blob'))
+        missing = file_ids - {file.id for file in files}
+        if missing:
+            raise NotFound(f"Файлы не найдены: {sorted(missing)}")
+        return files, target
+
+    def check_can_write(self, folders, message):
+        """Права проверяются один раз на каждую папку"""
+        for folder in {folder.id: folder for folder in folders}.values():
+            if not self.folder_access.can_write(folder):
+                raise PermissionDenied(message)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def batch_move(self, request):
+        """Перемещение нескольких файлов в папку одной транзакцией"""
+        files, target = self.get_batch_files(request, require_folder=True)
+        self.check_can_write([file.folder for file in files] + [target], "У вас нет прав на перемещение файлов")
+
+        if any(file.folder.project_id != target.project_id for file in files):
+            raise ValidationError("Нельзя переместить файл в папку другого проекта")
+        conflicts = find_name_conflicts(files, target)
+        if conflicts:
+            raise ValidationError({'error': "Файлы с такими именами уже существуют в целевой папке", 'names': conflicts})
+
+        moved = move_files(files, target)
+        log_events([
+            make_event(request.user, 'MOVE', 'file', object_id=file.id, name=file.name, parent_id=target.id)
+            for file in files if file.folder_id != target.id
+        ])
+        return Response({'files': moved})
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def batch_delete(self, request):
+        """Удаление нескольких файлов одной транзакцией"""
+        files, _ = self.get_batch_files(request)
+        self.check_can_write([file.folder for file in files], "У вас нет прав на удаление файлов")
+
+        deleted = delete_files(files)
+        log_events([
+            make_event(request.user, 'DELETE', 'file', object_id=file.id, name=file.name, parent_id=file.folder_id)
+            for file in files
+        ])
+        return Response({'files': deleted})
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def batch_copy(self, request):
+        """Копирование нескольких файлов в папку без копирования содержимого"""
+        files, target = self.get_batch_files(request, require_folder=True)
+        self.check_can_write([target], "У вас нет прав на загрузку файлов в эту папку")
+
+        conflicts = find_name_conflicts(files, target, exclude_sources=False)
+        if conflicts:
+            raise ValidationError({'error': "Файлы с такими именами уже существуют в целевой папке", 'names': conflicts})
+
+        copies = copy_files(files, target, request.user)
+        log_events([
+            make_event(request.user, 'CREATE', 'file', object_id=copy.id, name=copy.name, parent_id=target.id)
+            for copy in copies
+        ])
+        return Response(self.get_serializer(copies, many=True).data, status=status.HTTP_201_CREATED)
+
+class UploadSessionViewSet(FolderAccessMixin, viewsets.GenericViewSet):
+    """
+    Загрузка больших файлов по частям:
+    POST /uploads/ - начать загрузку (folder, name, size, mime_type),
+    PUT /uploads/<uuid>/chunk/?offset=N - дописать часть (тело запроса - байты),
+    GET /uploads/<uuid>/ - узнать, с какого смещения продолжать,
+    POST /uploads/<uuid>/complete/ - создать файл,
+    DELETE /uploads/<uuid>/ - отменить загрузку.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'uuid'
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(created_by=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        folder = serializer.validated_data['folder']
+
+        if not self.folder_access.can_write(folder):
+            raise PermissionDenied("У вас нет прав на загрузку файлов в эту папку")
+
+        if File.objects.filter(folder=folder, name=serializer.validated_data['name']).exists():
+            raise ValidationError("Файл с таким именем уже существует в папке")
+
+        session = start_upload(
+            folder,
+            request.user,
+            serializer.validated_data['name'],
+            serializer.validated_data['size'],
+            serializer.validated_data.get('mime_type', ''),
+        )
+        data = self.get_serializer(session).data
+        data['chunk_size'] = CHUNK_SIZE
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def destroy(self, request, *args, **kwargs):
+        cancel_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, uuid=None):
+        """Дописывает часть файла; тело запроса читается потоком, без разбора"""
+        session = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', ''))
+        except ValueError:
+            raise ValidationError("Необходимо указать смещение части (offset)")
+
+        try:
+            session = append_chunk(session.pk, request.stream, offset)
+        except OffsetMismatch as e:
+            return Response(
+                {"error": "Неверное смещение части", "offset": e.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'offset': session.offset, 'size': session.size})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, uuid=None):
+        session = self.get_object()
+        instance = complete_upload(session.pk)
+
+        log_events([make_event(
+            request.user,
+            'UPLOAD',
+            'file',
+            object_id=instance.id,
+            name=instance.name,
+            parent_id=instance.folder_id,
+        )])
+        return Response(FileSerializer(instance, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
+
+class FolderAccessViewSet(FolderAccessMixin, viewsets.ModelViewSet):
     serializer_class = FolderAccessSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         """Получение списка прав доступа"""
         user = self.request.user
+        # Права видят участники проекта, ГИП и автор папки
         return FolderAccess.objects.filter(
-            Q(folder__project__members__member__user=user) |  # Проверка через ProjectMember
-            Q(folder__project__gip__user=user) |             # Проверка ГИПа
-            Q(folder__created_by=user)
-        ).distinct()
+            visible_to(
+                user,
+                project_ref='folder__project',
+                folder_ref='folder',
+                sources=PROJECT_SOURCES + ['OWNER'],
+            )
+        )
 
     def perform_create(self, serializer):
         """Предоставление прав доступа"""
         folder = get_object_or_404(Folder, id=self.request.data.get('folder'))
         
         # Проверяем, что пользователь имеет права администратора
-        if not FolderAccess.objects.filter(
-            folder=folder,
-            user=self.request.user,
-            access_level='ADMIN'
-        ).exists():
+        if not self.folder_access.is_admin(folder):
             raise PermissionDenied("You don't have permission to manage access rights")
         
-        serializer.save(granted_by=self.request.user)
+        access = serializer.save(granted_by=self.request.user)
+        self.folder_access.invalidate(access.folder.project_id)
+
+    def perform_update(self, serializer):
+        previous_project_id = serializer.instance.folder.project_id
+        access = serializer.save()
+        self.folder_access.invalidate(previous_project_id)
+        self.folder_access.invalidate(access.folder.project_id)
+
+    def perform_destroy(self, instance):
+        project_id = instance.folder.project_id
+        instance.delete()
+        self.folder_access.invalidate(project_id)
+
+    def get_subtree_request(self, request):
+        serializer = FolderAccessSubtreeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        folder = serializer.validated_data['folder']
+        if not self.folder_access.is_admin(folder):
+            raise PermissionDenied("You don't have permission to manage access rights")
+        return folder, serializer.validated_data
+
+    @action(detail=False, methods=['post'])
+    def grant_subtree(self, request):
+        """Предоставление доступа к папке и всем ее подпапкам"""
+        folder, data = self.get_subtree_request(request)
+        if not data.get('access_level'):
+            raise ValidationError({'access_level': 'This field is required.'})
+
+        count = grant_subtree_access(folder, data['user'].id, data['access_level'], granted_by=request.user)
+        self.folder_access.invalidate(folder.project_id)
+        return Response({'folders': count})
+
+    @action(detail=False, methods=['post'])
+    def revoke_subtree(self, request):
+        """Отзыв доступа к папке и всем ее подпапкам"""
+        folder, data = self.get_subtree_request(request)
+        count = revoke_subtree_access(folder, data['user'].id)
+        self.folder_access.invalidate(folder.project_id)
+        return Response({'folders': count})
+
+class FolderActionLogPagination(CursorPagination):
+    """Постраничный вывод журнала по ключу (created_at, id) без OFFSET"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
 
 class FolderActionLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = FolderActionLogSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = FolderActionLogPagination
 
     def get_queryset(self):
-        queryset = FolderActionLog.objects.all()
+        queryset = FolderActionLog.objects.select_related(
+            'user__physical_profile',
+            'user__legal_profile',
+            'project',
+            'folder',
+            'file',
+        )
         
         # Фильтрация по проекту
         project_uuid = self.request.query_params.get('project')
@@ -0,0 +1,55 @@
+from django.db.models import Exists, OuterRef, Q
+from .models import FolderVisibility
+
+# Источники, дающие доступ ко всему проекту, а не к отдельной папке
+PROJECT_SOURCES = ['MEMBER', 'GIP']
+
+
+def visible_to(user, project_ref='project', folder_ref='pk', sources=None):
+    """
+    Условие EXISTS по индексу видимости для фильтрации папок, файлов
+    и прав доступа без JOIN по участникам проекта и DISTINCT.
+    """
+    rows = FolderVisibility.objects.filter(
+        user=user,
+        project=OuterRef(project_ref),
+    ).filter(
+        Q(folder__isnull=True) | Q(folder=OuterRef(folder_ref))
+    )
+    if sources:
+        rows = rows.filter(source__in=sources)
+    return Exists(rows)
+
+
+def grant_project_visibility(user_id, project_id, source):
+    FolderVisibility.objects.bulk_create(
+        [FolderVisibility(user_id=user_id, project_id=project_id, source=source)],
+        ignore_conflicts=True,
+    )
+
+
+def revoke_project_visibility(project_id, source, user_id=None, exclude_user_id=None):
+    rows = FolderVisibility.objects.filter(project_id=project_id, folder__isnull=True, source=source)
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    if exclude_user_id is not None:
+        rows = rows.exclude(user_id=exclude_user_id)
+    rows.delete()
+
+
+def grant_folder_visibility(rows, source):
+    """
+    Добавляет видимость папок одним запросом.
+    rows - итерируемое из (user_id, project_id, folder_id).
+    """
+    FolderVisibility.objects.bulk_create(
+        [
+            FolderVisibility(user_id=user_id, project_id=project_id, folder_id=folder_id, source=source)
+            for user_id, project_id, folder_id in rows
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def revoke_folder_visibility(user_id, folder_ids, source):
+    FolderVisibility.objects.filter(user_id=user_id, folder_id__in=folder_ids, source=source).delete()